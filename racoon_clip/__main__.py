@@ -231,9 +231,8 @@ def common_options(func):
         ),
         click.option(
             "-rl", "--read-length",
-            help= "Length of reads.",   
-            default=150,
-            show_default=True, 
+            help= "Length of reads, for the STAR sjdbOverhang (read length - 1 - barcode length). The read lengths are profiled from the input files; a different read_length overrides them.",   
+            default="",
         ),
         click.option(
             "--outFilterMismatchNoverReadLmax", "outFilterMismatchNoverReadLmax",
@@ -394,6 +393,28 @@ def create_config_dicts(workflow_type, working_directory, log, infiles, samples,
                     "morePureclipParameters": morePureclipParameters,
                     "fastqScreen": False,
                     "fastqScreen_config": "",
+                    "demultiplex_shards": 1,
+                    "demultiplex_backend": "flexbar",
+                    "barcode_mismatches": 0,
+                    "barcode_histogram_capacity": 500000,
+                    "compression_threads": 4,
+                    "compression_level": 6,
+                    "compression_stage_levels": "",
+                    "read_length_sample_size": 100000,
+                    "star_shared_memory": False,
+                    "star_sort_ram_mb": 4000,
+                    "star_index_cache": "",
+                    "star_pipe_sort": False,
+                    "sort_tmp_dir": "",
+                    "slim_bam": False,
+                    "keep_full_bam": True,
+                    "collapse_reads": False,
+                    "aligner": "star",
+                    "mir_single_star_pass": False,
+                    "dedup_backend": "umi_tools",
+                    "dedup_method": "unique",
+                    "fused_crosslinks": False,
+                    "crosslink_matrix": False,
                     }
     
     default_config = {"wdir": "./racoon_clip_out", 
@@ -422,7 +443,7 @@ def create_config_dicts(workflow_type, working_directory, log, infiles, samples,
                     "gtf":"",
                     "genome_fasta": "",
                     "star_index": "",
-                    "read_length": 150,
+                    "read_length": "",
                     "outFilterMismatchNoverReadLmax": 0.04,
                     "outFilterMismatchNmax": 999,
                     "outFilterMultimapNmax": 1,
@@ -435,6 +456,28 @@ def create_config_dicts(workflow_type, working_directory, log, infiles, samples,
                     "mir_5prime_missing_allowed": "0 1 2 3",
                     "fastqScreen": False,
                     "fastqScreen_config": "",
+                    "demultiplex_shards": 1,
+                    "demultiplex_backend": "flexbar",
+                    "barcode_mismatches": 0,
+                    "barcode_histogram_capacity": 500000,
+                    "compression_threads": 4,
+                    "compression_level": 6,
+                    "compression_stage_levels": "",
+                    "read_length_sample_size": 100000,
+                    "star_shared_memory": False,
+                    "star_sort_ram_mb": 4000,
+                    "star_index_cache": "",
+                    "star_pipe_sort": False,
+                    "sort_tmp_dir": "",
+                    "slim_bam": False,
+                    "keep_full_bam": True,
+                    "collapse_reads": False,
+                    "aligner": "star",
+                    "mir_single_star_pass": False,
+                    "dedup_backend": "umi_tools",
+                    "dedup_method": "unique",
+                    "fused_crosslinks": False,
+                    "crosslink_matrix": False,
                     "morePureclipParameters": "",
                     }
     
@@ -0,0 +1,184 @@
+"""Aligner backends of the align and align_chimeric rules.
+
+star is the default. hisat2 is a splice-aware alternative with a much smaller
+index (about 8 GB resident for the human genome instead of about 32 GB). Both
+write <prefix>Aligned.sortedByCoord.out.bam and a STAR style <prefix>Log.final.out
+for the report. hisat2 indices are built without splice sites (building them
+in needs more memory than STAR); the splice sites of the GTF are passed at
+alignment time instead.
+
+The STAR style log is also written for the parts of a combined STAR run
+(mir_single_star_pass), from read counts taken of the split BAM files.
+"""
+
+import argparse
+
+ALIGNERS = ("star", "hisat2")
+# HISAT2's maximum mismatch penalty (--mp 6,2)
+HISAT2_MISMATCH_PENALTY = 6
+
+# rows of STAR's Log.final.out (None is the empty line); the report reads the
+# rows by position
+STAR_LOG_ROWS = (
+    "Started job on",
+    "Started mapping on",
+    "Finished on",
+    "Mapping speed, Million of reads per hour",
+    None,
+    "Number of input reads",
+    "Average input read length",
+    "UNIQUE READS:",
+    "Uniquely mapped reads number",
+    "Uniquely mapped reads %",
+    "Average mapped length",
+    "Number of splices: Total",
+    "Number of splices: Annotated (sjdb)",
+    "Number of splices: GT/AG",
+    "Number of splices: GC/AG",
+    "Number of splices: AT/AC",
+    "Number of splices: Non-canonical",
+    "Mismatch rate per base, %",
+    "Deletion rate per base",
+    "Deletion average length",
+    "Insertion rate per base",
+    "Insertion average length",
+    "MULTI-MAPPING READS:",
+    "Number of reads mapped to multiple loci",
+    "% of reads mapped to multiple loci",
+    "Number of reads mapped to too many loci",
+    "% of reads mapped to too many loci",
+    "UNMAPPED READS:",
+    "Number of reads unmapped: too many mismatches",
+    "% of reads unmapped: too many mismatches",
+    "Number of reads unmapped: too short",
+    "% of reads unmapped: too short",
+    "Number of reads unmapped: other",
+    "% of reads unmapped: other",
+    "CHIMERIC READS:",
+    "Number of chimeric reads",
+    "% of chimeric reads",
+)
+
+
+def check_aligner(name):
+    """Validate the aligner setting; returns it in lower case."""
+    aligner = str(name).strip().lower()
+    if aligner not in ALIGNERS:
+        raise ValueError(f"Input Error: aligner must be one of {', '.join(ALIGNERS)}, not '{name}'.")
+    return aligner
+
+
+def hisat2_options(mismatch_ratio, multimap_max):
+    """HISAT2 options matching STAR's mismatch and multimapping filters.
+
+    A read may have mismatch_ratio * length mismatches, like
+    --outFilterMismatchNoverReadLmax. Soft-clipping is disabled, so the read
+    start (the crosslink) is kept like with --alignEndsType Extend5pOfRead1.
+    Up to multimap_max + 1 alignments are reported, so reads mapped to too
+    many loci can be recognised by their NH tag and removed.
+    """
+    slope = HISAT2_MISMATCH_PENALTY * float(mismatch_ratio)
+    return f"--no-softclip --no-unal --score-min L,0,-{slope:g} -k {int(multimap_max) + 1}"
+
+
+def parse_hisat2_summary(text):
+    """Read counts of a HISAT2 --new-summary file (single-end reads)."""
+    counts = {}
+    for line in text.splitlines():
+        label, _, value = line.strip().partition(":")
+        if not value:
+            continue
+        number = value.split()[0]
+        if label == "Total reads":
+            counts["input"] = int(number)
+        elif label == "Aligned 0 time":
+            counts["unmapped"] = int(number)
+        elif label == "Aligned 1 time":
+            counts["unique"] = int(number)
+        elif label == "Aligned >1 times":
+            counts["multi"] = int(number)
+    missing = {"input", "unmapped", "unique", "multi"} - set(counts)
+    if missing:
+        raise ValueError(f"Not a HISAT2 summary, missing: {', '.join(sorted(missing))}")
+    return counts
+
+
+def alignment_counts(input_reads, unique, multi):
+    """Read counts of one part of an alignment, from its reads and BAM file.
+
+    Reads that are not in the BAM file (unmapped or filtered by STAR) are
+    counted as unmapped.
+    """
+    unmapped = int(input_reads) - int(unique) - int(multi)
+    if unmapped < 0:
+        raise ValueError(f"More aligned reads ({int(unique) + int(multi)}) than input reads ({input_reads})")
+    return {"input": int(input_reads), "unmapped": unmapped, "unique": int(unique), "multi": int(multi)}
+
+
+def star_log(counts, multimap_max, kept_multi=None):
+    """STAR style Log.final.out text for the read counts of another aligner.
+
+    kept_multi is the number of multimapping reads left after the filter for
+    at most multimap_max loci (from the BAM file); the other multimapping
+    reads are counted as mapped to too many loci. Without it, all of them
+    are, unless multimap_max is above 1. Values the aligner does not report
+    are 0.
+    """
+    total = counts["input"]
+    if kept_multi is not None:
+        if not 0 <= int(kept_multi) <= counts["multi"]:
+            raise ValueError(f"{kept_multi} kept multimapping reads, but {counts['multi']} multimapping reads")
+        multi, too_many = int(kept_multi), counts["multi"] - int(kept_multi)
+    elif int(multimap_max) <= 1:
+        multi, too_many = 0, counts["multi"]
+    else:
+        multi, too_many = counts["multi"], 0
+
+    def percent(number):
+        return f"{100 * number / total:.2f}%" if total else "0.00%"
+
+    values = {
+        "Number of input reads": total,
+        "Uniquely mapped reads number": counts["unique"],
+        "Uniquely mapped reads %": percent(counts["unique"]),
+        "Number of reads mapped to multiple loci": multi,
+        "% of reads mapped to multiple loci": percent(multi),
+        "Number of reads mapped to too many loci": too_many,
+        "% of reads mapped to too many loci": percent(too_many),
+        "Number of reads unmapped: other": counts["unmapped"],
+        "% of reads unmapped: other": percent(counts["unmapped"]),
+    }
+    lines = []
+    for label in STAR_LOG_ROWS:
+        if label is None:
+            lines.append("")
+        elif label.endswith(":") and label.isupper():
+            lines.append(f"{label:>48}")
+        elif "%" in label or "rate" in label:
+            lines.append(f"{label:>48} |\t{values.get(label, '0.00%')}")
+        else:
+            lines.append(f"{label:>48} |\t{values.get(label, 0)}")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a STAR style Log.final.out from a HISAT2 summary or read counts")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--summary")
+    source.add_argument("--counts", nargs=3, type=int, metavar=("INPUT", "UNIQUE", "MULTI"))
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--multimap-max", type=int, default=1)
+    parser.add_argument("--kept-multi", type=int,
+                        help="with --summary, multimapping reads left after the filter for at most --multimap-max loci")
+    args = parser.parse_args()
+    if args.counts:
+        counts = alignment_counts(*args.counts)
+    else:
+        with open(args.summary) as handle:
+            counts = parse_hisat2_summary(handle.read())
+    with open(args.output, "w") as handle:
+        handle.write(star_log(counts, args.multimap_max, args.kept_multi if args.summary else None))
+
+
+if __name__ == "__main__":
+    main()
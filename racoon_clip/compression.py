@@ -0,0 +1,73 @@
+"""Build the compression commands shared by all FASTQ preprocessing rules."""
+
+import shlex
+
+# Stages that write intermediate .fastq.gz files through the backend.
+STAGES = (
+    "multiplexed_split",
+    "multiplexed_preprocessing",
+    "native_demultiplex",
+    "umi_filter",
+    "headers",
+    "non_chimeric",
+    "collapsed",
+)
+
+# first bytes of a BGZF block: gzip magic, deflate and the extra field flag
+BGZF_MAGIC = "1f8b0804"
+
+
+def parse_stage_levels(value):
+    """Parse 'stage=level stage=level' into a dict of compression levels."""
+    levels = {}
+    for item in str(value or "").replace(",", " ").split():
+        stage, separator, level = item.partition("=")
+        if not separator or stage not in STAGES:
+            raise ValueError(
+                f"Invalid compression_stage_levels entry '{item}'. "
+                f"Use stage=level with stage one of: {', '.join(STAGES)}."
+            )
+        levels[stage] = check_level(level)
+    return levels
+
+
+def check_level(level):
+    """Return level as int if it is a valid BGZF/deflate compression level."""
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        raise ValueError(f"Compression level must be an integer, got '{level}'.") from None
+    if not 0 <= level <= 9:
+        raise ValueError(f"Compression level must be between 0 and 9, got {level}.")
+    return level
+
+
+def stage_level(stage, default_level, stage_levels):
+    """Return the compression level configured for stage."""
+    if stage not in STAGES:
+        raise ValueError(f"Unknown compression stage '{stage}'.")
+    return stage_levels.get(stage, check_level(default_level))
+
+
+def compress_command(threads, level):
+    """Multi-threaded BGZF compression from stdin to stdout.
+
+    BGZF is a series of gzip members, so zcat, flexbar and STAR read it as
+    ordinary gzip.
+    """
+    return f"bgzip --threads {max(int(threads), 1)} --compress-level {level} --stdout"
+
+
+def decompress_command(threads, path):
+    """Decompression of path from stdin to stdout.
+
+    The content decides, not the suffix: BGZF input is inflated in parallel
+    by bgzip, anything else goes through zcat -f, which reads plain gzip and
+    passes uncompressed files through (as the rules did before).
+    """
+    magic = f"$(head -c 4 {shlex.quote(str(path))} | od -An -tx1 | tr -d ' \\n')"
+    return (
+        f'if [ "{magic}" = {BGZF_MAGIC} ]; '
+        f"then bgzip --threads {max(int(threads), 1)} --decompress --stdout; "
+        "else zcat -f; fi"
+    )
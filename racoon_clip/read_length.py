@@ -0,0 +1,81 @@
+"""Profile the read lengths of the input files to set STAR's sjdbOverhang."""
+
+import gzip
+import json
+import os
+from collections import Counter
+from pathlib import Path
+
+
+def sample_read_lengths(path, sample_size):
+    """Count the read lengths of the first sample_size records of a (gzipped) FASTQ."""
+    with open(path, "rb") as handle:
+        magic = handle.read(2)
+    opener = gzip.open if magic == b"\x1f\x8b" else open
+    lengths = Counter()
+    with opener(path, "rb") as handle:
+        for line_number, line in enumerate(handle):
+            if line_number % 4 != 1:
+                continue
+            lengths[len(line.rstrip(b"\r\n"))] += 1
+            if line_number // 4 + 1 >= sample_size:
+                break
+    return lengths
+
+
+def profile_read_lengths(paths, cache_file, sample_size):
+    """Return {path: Counter of read lengths} for every input file.
+
+    Profiles are cached in cache_file and reused as long as size and
+    modification time of a file and the sample size are unchanged.
+    """
+    cache_path = Path(cache_file)
+    try:
+        cache = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        cache = {}
+
+    profiles = {}
+    changed = False
+    for path in paths:
+        stat = os.stat(path)
+        key = str(Path(path).resolve())
+        signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sample_size": sample_size}
+        entry = cache.get(key)
+        if entry is None or any(entry.get(name) != value for name, value in signature.items()):
+            lengths = sample_read_lengths(path, sample_size)
+            entry = dict(signature, lengths={str(length): count for length, count in sorted(lengths.items())})
+            cache[key] = entry
+            changed = True
+        profiles[path] = Counter({int(length): count for length, count in entry["lengths"].items()})
+
+    if changed:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = cache_path.with_name(f"{cache_path.name}.{os.getpid()}")
+            temporary.write_text(json.dumps(cache, indent=1, sort_keys=True))
+            os.replace(temporary, cache_path)
+        except OSError:
+            pass  # profiling is cheap, a missing cache only costs time
+    return profiles
+
+
+def trimmed_lengths(lengths, trimmed):
+    """Read lengths after removing `trimmed` bases from every read."""
+    result = Counter()
+    for length, count in lengths.items():
+        result[max(length - trimmed, 0)] += count
+    return result
+
+
+def sjdb_overhang(lengths):
+    """STAR's recommended sjdbOverhang: maximum read length - 1 (at least 1)."""
+    return max(max(lengths, default=0) - 1, 1)
+
+
+def summary(lengths):
+    """Minimum, most frequent and maximum length of a length distribution."""
+    if not lengths:
+        return "no reads"
+    mode = max(lengths.items(), key=lambda item: (item[1], item[0]))[0]
+    return f"{sum(lengths.values())} reads, length min {min(lengths)}, mode {mode}, max {max(lengths)}"
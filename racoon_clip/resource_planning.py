@@ -0,0 +1,66 @@
+"""Plan thread counts per rule from the core budget and the number of samples."""
+
+from collections import OrderedDict
+from math import ceil
+
+# Parallel scaling per tool: (serial fraction, thread count beyond which the
+# tool does not get faster). Runtime on t threads is modelled as
+#   serial + (1 - serial) / min(t, knee)
+TOOL_SCALING = {
+    "flexbar": (0.10, 8),
+    "demultiplex_native": (0.15, 16),
+    "star_align": (0.05, 24),
+    "star_index": (0.10, 32),
+    "hisat2": (0.05, 16),
+    "hisat2_index": (0.15, 16),
+    "bowtie2": (0.05, 16),
+    "dedup_native": (0.10, 16),
+    "crosslinks": (0.05, 24),
+    "pureclip": (0.20, 16),
+}
+
+
+def runtime(tool, threads):
+    """Relative runtime of tool on threads threads (1.0 on one thread)."""
+    serial, knee = TOOL_SCALING[tool]
+    return serial + (1 - serial) / min(threads, knee)
+
+
+def job_threads(tool, cores, jobs=1, reserve=0):
+    """Threads per job that finish `jobs` equal jobs of tool the fastest.
+
+    Jobs run in waves of cores // threads concurrent jobs. Of equally fast
+    choices the smallest thread count is taken to leave cores to other rules.
+    `reserve` cores are kept free for rules running alongside.
+    """
+    cores = max(int(cores or 1) - reserve, 1)
+    jobs = max(int(jobs), 1)
+    best_threads, best_time = 1, None
+    for threads in range(1, cores + 1):
+        waves = ceil(jobs / (cores // threads))
+        time = waves * runtime(tool, threads)
+        if best_time is None or time < best_time - 1e-9:
+            best_threads, best_time = threads, time
+    return best_threads
+
+
+def plan_threads(cores, samples, shards=1, aligner="star"):
+    """Return an ordered mapping of rule kind to thread count."""
+    samples = max(int(samples), 1)
+    align, index = ("hisat2", "hisat2_index") if aligner == "hisat2" else ("star_align", "star_index")
+    return OrderedDict([
+        ("demultiplex", job_threads("flexbar", cores)),
+        ("demultiplex_shard", job_threads("flexbar", cores, shards)),
+        ("demultiplex_native", job_threads("demultiplex_native", cores)),
+        ("demultiplex_native_shard", job_threads("demultiplex_native", cores, shards)),
+        ("barcode_trimming_native", job_threads("demultiplex_native", cores, samples)),
+        ("adapter_trimming", job_threads("flexbar", cores, samples)),
+        ("trim3", job_threads("flexbar", cores, samples)),
+        ("index", job_threads(index, cores, reserve=2)),
+        ("align", job_threads(align, cores, samples)),
+        ("align_miR", job_threads("bowtie2", cores, samples)),
+        ("align_chimeric", job_threads(align, cores, samples)),
+        ("deduplication", job_threads("dedup_native", cores, samples)),
+        ("crosslinks", job_threads("crosslinks", cores, samples)),
+        ("peak_calling", job_threads("pureclip", cores, reserve=2)),
+    ])
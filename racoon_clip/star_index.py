@@ -0,0 +1,228 @@
+"""STAR indices: annotation manifest and a content-addressed index cache.
+
+create_STAR_index builds the index with --sjdbGTFfile/--sjdbOverhang and
+records GTF and overhang in MANIFEST inside the index directory. Alignments
+only insert the GTF junctions on the fly if the index does not already
+contain them.
+
+With an index cache directory, indices are stored as <cache>/star_<key>/,
+where the key is a hash of the genome FASTA and GTF contents, the overhang
+and the STAR version, so any project with the same inputs reuses them.
+Builds hold a file lock, so concurrent runs never build the same index twice.
+A prebuilt index (star_index) is added to the cache as a link if its manifest
+shows that it was built from the same inputs.
+
+Also run as a script by the index rules (stdlib only, so it works inside the
+conda envs).
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+MANIFEST = "racoon_clip_index.json"
+HASH_CACHE = "file_hashes.json"
+
+
+def file_signature(path):
+    """Resolved path, size and modification time of a file."""
+    stat = os.stat(path)
+    return {"path": str(Path(path).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_sha256(path, hash_cache=None):
+    """SHA-256 of a file's content; remembered in hash_cache by path, size and mtime."""
+    signature = file_signature(path)
+    key = f"{signature['path']}:{signature['size']}:{signature['mtime_ns']}"
+    hashes = {}
+    if hash_cache is not None:
+        try:
+            hashes = json.loads(Path(hash_cache).read_text())
+        except (OSError, ValueError):
+            hashes = {}
+        if key in hashes:
+            return hashes[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 24), b""):
+            digest.update(block)
+    if hash_cache is not None:
+        hashes[key] = digest.hexdigest()
+        temporary = Path(f"{hash_cache}.{os.getpid()}")
+        try:
+            temporary.write_text(json.dumps(hashes, indent=1, sort_keys=True))
+            os.replace(temporary, hash_cache)
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+def star_version(env_file):
+    """STAR version pinned in a conda environment file, or None."""
+    match = re.search(r"^\s*-\s*star=([^=\s]+)", Path(env_file).read_text(), re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def cache_key(genome_fasta, gtf, overhang, version, hash_cache=None):
+    """Key of an index in the cache: hash of inputs, overhang and STAR version."""
+    content = json.dumps({
+        "genome_fasta": file_sha256(genome_fasta, hash_cache),
+        "gtf": file_sha256(gtf, hash_cache),
+        "sjdbOverhang": int(overhang),
+        "star_version": version,
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:20]
+
+
+def cached_index(cache_dir, genome_fasta, gtf, overhang, version):
+    """Directory of the index for these inputs in cache_dir (may not exist yet)."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    key = cache_key(genome_fasta, gtf, overhang, version, cache_dir / HASH_CACHE)
+    return f"{cache_dir.resolve()}/star_{key}/"
+
+
+def index_complete(index_dir):
+    """True if a cache index has been built completely (its manifest is written last)."""
+    return (Path(str(index_dir).rstrip("/")) / MANIFEST).exists()
+
+
+def adopt_index(index_dir, cache_dir, genome_fasta, gtf, overhang, version):
+    """Add a prebuilt index to the cache as a link <cache>/star_<key>.
+
+    Only indices whose manifest lists these genome FASTA and GTF files (path,
+    size and modification time), overhang and STAR version are added, so the
+    key matches their content. Returns the cache entry, or None if the index
+    does not match.
+    """
+    manifest = read_manifest(index_dir)
+    if (
+        manifest is None
+        or manifest.get("gtf") != file_signature(gtf)
+        or manifest.get("genome_fasta") != file_signature(genome_fasta)
+        or manifest.get("sjdbOverhang") != int(overhang)
+        or manifest.get("star_version") != version
+    ):
+        return None
+    entry = Path(cached_index(cache_dir, genome_fasta, gtf, overhang, version).rstrip("/"))
+    with open(f"{entry}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not index_complete(entry):
+            # a link left from an index that was removed since
+            if entry.is_symlink():
+                entry.unlink()
+            link = entry.with_name(entry.name + ".link")
+            if link.is_symlink():
+                link.unlink()
+            link.symlink_to(Path(index_dir).resolve(), target_is_directory=True)
+            os.replace(link, entry)
+    return f"{entry}/"
+
+
+def build_locked(index_dir, genome_fasta, gtf, overhang, threads):
+    """Build a cache index unless it exists; returns True if it was built.
+
+    The index is generated next to its final place and renamed when complete,
+    under an exclusive lock on <index_dir>.lock.
+    """
+    index_dir = Path(str(index_dir).rstrip("/"))
+    index_dir.parent.mkdir(parents=True, exist_ok=True)
+    with open(f"{index_dir}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if index_complete(index_dir):
+            return False
+        partial = index_dir.with_name(index_dir.name + ".partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir()
+        subprocess.run(
+            [
+                "STAR", "--runThreadN", str(threads), "--runMode", "genomeGenerate",
+                "--genomeDir", str(partial), "--genomeFastaFiles", str(genome_fasta),
+                "--sjdbGTFfile", str(gtf), "--sjdbOverhang", str(overhang),
+                "--outFileNamePrefix", f"{partial}/",
+            ],
+            check=True,
+        )
+        version = subprocess.run(["STAR", "--version"], capture_output=True, text=True).stdout.strip()
+        write_manifest(partial, gtf, overhang, genome_fasta, version or None)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.rename(partial, index_dir)
+    return True
+
+
+def write_manifest(index_dir, gtf, overhang, genome_fasta=None, star_version=None):
+    manifest = {
+        "gtf": file_signature(gtf),
+        "sjdbOverhang": int(overhang),
+        "genome_fasta": file_signature(genome_fasta) if genome_fasta else None,
+        "star_version": star_version,
+    }
+    path = Path(index_dir) / MANIFEST
+    path.write_text(json.dumps(manifest, indent=1, sort_keys=True) + "\n")
+    return manifest
+
+
+def read_manifest(index_dir):
+    """The manifest of an index, or None for indices built without one."""
+    try:
+        return json.loads((Path(index_dir) / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def junction_options(index_dir, gtf, overhang):
+    """STAR alignment options for the annotated junctions.
+
+    Empty if the index already contains the junctions of gtf. An index built
+    with another overhang is used as it is (STAR cannot insert junctions into
+    it with a different overhang). Otherwise the junctions are inserted on
+    the fly.
+    """
+    if annotated_overhang(index_dir, gtf) is not None:
+        return ""
+    return f"--sjdbGTFfile {gtf} --sjdbOverhang {overhang}"
+
+
+def annotated_overhang(index_dir, gtf):
+    """The overhang the junctions of gtf were built into the index with, or None."""
+    manifest = read_manifest(index_dir)
+    if manifest is None or manifest.get("gtf") != file_signature(gtf):
+        return None
+    return manifest["sjdbOverhang"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    manifest = commands.add_parser("manifest", help="write the manifest of a STAR index")
+    manifest.add_argument("--index", required=True)
+    manifest.add_argument("--gtf", required=True)
+    manifest.add_argument("--sjdb-overhang", type=int, required=True)
+    manifest.add_argument("--genome-fasta")
+    manifest.add_argument("--star-version")
+
+    build = commands.add_parser("build", help="build a cache index unless another run already did")
+    build.add_argument("--index", required=True)
+    build.add_argument("--gtf", required=True)
+    build.add_argument("--sjdb-overhang", type=int, required=True)
+    build.add_argument("--genome-fasta", required=True)
+    build.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "manifest":
+        write_manifest(args.index, args.gtf, args.sjdb_overhang, args.genome_fasta, args.star_version)
+    elif build_locked(args.index, args.genome_fasta, args.gtf, args.sjdb_overhang, args.threads):
+        print(f"Built STAR index {args.index}")
+    else:
+        print(f"STAR index found in cache: {args.index}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Locate and remove a STAR genome loaded into shared memory."""
+
+import os
+import subprocess
+
+# STAR derives the System V key of a shared genome with
+# ftok(genomeDir, SHM_projectID)
+SHM_PROJECT_ID = 23
+
+
+def shm_key(genome_dir):
+    """Shared memory key of the genome in genome_dir (glibc ftok)."""
+    stat = os.stat(genome_dir)
+    return (stat.st_ino & 0xFFFF) | ((stat.st_dev & 0xFF) << 16) | ((SHM_PROJECT_ID & 0xFF) << 24)
+
+
+def remove_shared_genome(genome_dir):
+    """Mark the shared genome segment of genome_dir for removal.
+
+    Works without STAR (e.g. in onerror handlers outside the conda env);
+    processes still attached keep the segment until they exit. Returns True
+    if a segment was found.
+    """
+    if not os.path.isdir(genome_dir):
+        return False
+    result = subprocess.run(["ipcrm", "-M", str(shm_key(genome_dir))], capture_output=True)
+    return result.returncode == 0
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Bounded-memory histogram of the barcode region of multiplexed reads.
+
+The experimental barcode is counted exactly (there are few distinct ones).
+The full barcode + UMI2 string is counted with a Space-Saving sketch that
+keeps at most `capacity` strings: while fewer distinct strings are seen the
+counts are exact, afterwards every retained count is an upper bound that is
+at most `error` too high, and every string occurring more than
+reads / capacity times is retained.
+
+Binary layout (little-endian), readable with R readBin:
+  8 byte magic, uint32 n_experimental, uint32 n_full, float64 reads,
+  float64 floor (count a string missing from the sketch may at most have),
+  n_experimental NUL-terminated barcodes, n_experimental float64 counts,
+  n_full NUL-terminated barcodes, n_full float64 counts, n_full float64 errors.
+Entries are sorted by decreasing count, then barcode.
+"""
+
+import argparse
+import heapq
+import struct
+from collections import Counter
+
+MAGIC = b"RCBCHST1"
+HEADER = struct.Struct("<8sIIdd")
+
+
+class SpaceSaving:
+    """Space-Saving top-k counter (Metwally et al. 2005)."""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Barcode histogram capacity must be at least 1")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+        self._heap = None
+
+    def add(self, item):
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.capacity:
+            counts[item] = 1
+        else:
+            self._replace_min(item)
+
+    def _replace_min(self, item):
+        # the heap is built on the first eviction; entries go stale when a
+        # count grows and are refreshed when they reach the top
+        heap = self._heap
+        if heap is None:
+            heap = self._heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(heap)
+        while True:
+            count, key = heapq.heappop(heap)
+            current = self.counts[key]
+            if current == count:
+                break
+            heapq.heappush(heap, (current, key))
+        del self.counts[key]
+        self.errors.pop(key, None)
+        self.counts[item] = count + 1
+        self.errors[item] = count
+        self.floor = count
+        heapq.heappush(heap, (count + 1, item))
+
+    def items(self):
+        """(barcode, count, error) sorted by decreasing count, then barcode."""
+        errors = self.errors
+        return [
+            (key, count, errors.get(key, 0))
+            for key, count in sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        ]
+
+
+class BarcodeHistogram:
+    def __init__(self, capacity):
+        self.reads = 0
+        self.experimental = Counter()
+        self.full = SpaceSaving(capacity)
+
+    def add(self, barcode, experimental_length):
+        self.reads += 1
+        self.experimental[barcode[:experimental_length]] += 1
+        self.full.add(barcode)
+
+    def write_text(self, path):
+        """Full barcode counts in the layout of sort | uniq -c | sort -k1,1rn."""
+        with open(path, "w") as handle:
+            for barcode, count, _ in self.full.items():
+                handle.write(f"{count:7d} {barcode.decode()}\n")
+
+    def write_binary(self, path):
+        experimental = sorted(self.experimental.items(), key=lambda item: (-item[1], item[0]))
+        full = self.full.items()
+        with open(path, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, len(experimental), len(full), self.reads, self.full.floor))
+            handle.write(b"".join(barcode + b"\0" for barcode, _ in experimental))
+            handle.write(struct.pack(f"<{len(experimental)}d", *(count for _, count in experimental)))
+            handle.write(b"".join(barcode + b"\0" for barcode, _, _ in full))
+            handle.write(struct.pack(f"<{len(full)}d", *(count for _, count, _ in full)))
+            handle.write(struct.pack(f"<{len(full)}d", *(error for _, _, error in full)))
+
+
+def read_binary(path):
+    """Return (reads, floor, experimental dict, full dict of (count, error))."""
+    with open(path, "rb") as handle:
+        data = handle.read()
+    magic, n_experimental, n_full, reads, floor = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a racoon_clip barcode histogram")
+    offset = HEADER.size
+
+    def strings(n):
+        nonlocal offset
+        values = data[offset:].split(b"\0", n)[:n]
+        offset += sum(len(value) + 1 for value in values)
+        return values
+
+    def numbers(n):
+        nonlocal offset
+        values = struct.unpack_from(f"<{n}d", data, offset)
+        offset += 8 * n
+        return [int(value) for value in values]
+
+    experimental_barcodes = strings(n_experimental)
+    experimental = dict(zip(experimental_barcodes, numbers(n_experimental)))
+    full_barcodes = strings(n_full)
+    counts = numbers(n_full)
+    errors = numbers(n_full)
+    full = {barcode: (count, error) for barcode, count, error in zip(full_barcodes, counts, errors)}
+    return int(reads), int(floor), experimental, full
+
+
+def merge(paths, capacity):
+    """Merge shard histograms; strings missing from a saturated shard sketch
+    are charged that shard's floor, so merged counts stay upper bounds."""
+    histogram = BarcodeHistogram(capacity)
+    shards = [read_binary(path) for path in paths]
+    keys = set()
+    for reads, _, experimental, full in shards:
+        histogram.reads += reads
+        histogram.experimental.update(experimental)
+        keys.update(full)
+    merged = {}
+    for key in keys:
+        count = error = 0
+        for _, floor, _, full in shards:
+            shard_count, shard_error = full.get(key, (floor, floor))
+            count += shard_count
+            error += shard_error
+        merged[key] = (count, error)
+    floor = sum(shard[1] for shard in shards)
+    retained = sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))
+    if len(retained) > capacity:
+        floor = max(floor, retained[capacity][1][0])
+        retained = retained[:capacity]
+    histogram.full.counts = {key: count for key, (count, _) in retained}
+    histogram.full.errors = {key: error for key, (_, error) in retained if error}
+    histogram.full.floor = floor
+    return histogram
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge_parser = commands.add_parser("merge", help="merge barcode histograms of several shards")
+    merge_parser.add_argument("--inputs", nargs="+", required=True)
+    merge_parser.add_argument("--histogram-out", required=True)
+    merge_parser.add_argument("--text-out", required=True)
+    merge_parser.add_argument("--capacity", type=int, required=True)
+    args = parser.parse_args()
+
+    histogram = merge(args.inputs, args.capacity)
+    histogram.write_binary(args.histogram_out)
+    histogram.write_text(args.text_out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Collapse identical reads before the alignment and expand them afterwards.
+
+collapse: reads with the same sequence (and the same UMI, the part of the read
+ID after the last "_") are written once, as their first occurrence, with the
+number of reads prefixed to the ID: "@x<count>:<ID>". The counts are taken in
+a first pass over the input, so only the distinct keys are held in memory, as
+16 byte digests.
+
+expand: writes every record of a BAM file <count> times with the prefix
+removed, as if all reads had been aligned. Needs pysam.
+
+star-log: writes the STAR style Log.final.out of all reads from the log of the
+collapsed reads. Mapped reads are counted from the BAM file, every primary
+alignment with its count; the remaining reads are split between the unmapped
+rows in the proportions of the collapsed reads. Needs pysam.
+"""
+
+import argparse
+import hashlib
+import re
+import subprocess
+import sys
+
+from fastq_io import read_records
+
+COUNT_PREFIX = re.compile(rb"^x(\d+):")
+
+# rows of Log.final.out with the reads that are not in the BAM file
+UNMAPPED_ROWS = (
+    "Number of reads mapped to too many loci",
+    "Number of reads unmapped: too many mismatches",
+    "Number of reads unmapped: too short",
+    "Number of reads unmapped: other",
+)
+PERCENT_ROWS = {
+    "Uniquely mapped reads %": "Uniquely mapped reads number",
+    "% of reads mapped to multiple loci": "Number of reads mapped to multiple loci",
+    "% of reads mapped to too many loci": "Number of reads mapped to too many loci",
+    "% of reads unmapped: too many mismatches": "Number of reads unmapped: too many mismatches",
+    "% of reads unmapped: too short": "Number of reads unmapped: too short",
+    "% of reads unmapped: other": "Number of reads unmapped: other",
+}
+
+
+def read_key(header, sequence, umi):
+    """Collapsing key of a record: a digest of its sequence, plus the UMI of the read ID."""
+    if umi:
+        name = header.split(None, 1)[0]
+        sequence = sequence + b"_" + name.rpartition(b"_")[2]
+    return hashlib.blake2b(sequence, digest_size=16).digest()
+
+
+def count_keys(records, umi):
+    """Number of reads per key."""
+    counts = {}
+    for header, sequence, _, _ in records:
+        key = read_key(header, sequence, umi)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def collapse(records, counts, output, umi):
+    """Write the first record of every key with its count; returns the number written."""
+    written = 0
+    for header, sequence, plus, quality in records:
+        count = counts.pop(read_key(header, sequence, umi), None)
+        if count is None:
+            continue
+        output.write(b"@x%d:" % count + header[1:] + sequence + plus + quality)
+        written += 1
+    return written
+
+
+def read_count(name):
+    """(count, original name) of a collapsed read name."""
+    match = COUNT_PREFIX.match(name.encode())
+    if match is None:
+        return 1, name
+    return int(match.group(1)), name[match.end():]
+
+
+def expand(input_bam, output_bam, threads=1, index=False):
+    """Write every alignment as often as its read occurred; returns (in, out) records."""
+    import pysam
+
+    records = written = 0
+    with pysam.AlignmentFile(input_bam, "rb", threads=threads) as source:
+        with pysam.AlignmentFile(output_bam, "wb", template=source, threads=threads) as target:
+            for read in source:
+                count, read.query_name = read_count(read.query_name)
+                for _ in range(count):
+                    target.write(read)
+                records += 1
+                written += count
+    if index:
+        pysam.index("-@", str(threads), output_bam)
+    return records, written
+
+
+def mapped_reads(bam):
+    """(uniquely, multi) mapped reads of a BAM file of collapsed reads."""
+    import pysam
+
+    unique = multi = 0
+    with pysam.AlignmentFile(bam, "rb") as source:
+        for read in source.fetch(until_eof=True):
+            if read.is_unmapped or read.is_secondary or read.is_supplementary:
+                continue
+            count = read_count(read.query_name)[0]
+            if read.has_tag("NH") and read.get_tag("NH") > 1:
+                multi += count
+            else:
+                unique += count
+    return unique, multi
+
+
+def split_reads(total, weights):
+    """Split total in the proportions of weights (all to the last if they are 0)."""
+    whole = sum(weights)
+    if whole == 0:
+        return [0] * (len(weights) - 1) + [total]
+    shares = [total * weight // whole for weight in weights]
+    # the rest goes to the largest remainders
+    order = sorted(range(len(weights)), key=lambda number: total * weights[number] % whole, reverse=True)
+    for number in order[:total - sum(shares)]:
+        shares[number] += 1
+    return shares
+
+
+def star_log(text, input_reads, unique, multi):
+    """Log.final.out text of all reads from the one of the collapsed reads."""
+    rows = [line.partition(" |\t") for line in text.splitlines()]
+    distinct = {label.strip(): value.strip() for label, _, value in rows}
+    unmapped = input_reads - unique - multi
+    if unmapped < 0:
+        raise ValueError(f"More aligned reads ({unique + multi}) than input reads ({input_reads})")
+    values = {
+        "Number of input reads": input_reads,
+        "Uniquely mapped reads number": unique,
+        "Number of reads mapped to multiple loci": multi,
+    }
+    values.update(zip(UNMAPPED_ROWS, split_reads(unmapped, [int(distinct.get(row, 0)) for row in UNMAPPED_ROWS])))
+    for label, number in PERCENT_ROWS.items():
+        values[label] = f"{100 * values[number] / input_reads:.2f}%" if input_reads else "0.00%"
+    lines = []
+    for label, separator, value in rows:
+        if separator and label.strip() in values:
+            value = values[label.strip()]
+        lines.append(f"{label}{separator}{value}")
+    return "\n".join(lines) + "\n"
+
+
+def read_stats(path):
+    """Input reads of a --stats-out file."""
+    with open(path) as handle:
+        return int(handle.read().splitlines()[1].split("\t")[1])
+
+
+def open_decompressed(path, decompress):
+    handle = open(path, "rb")
+    process = subprocess.Popen(decompress, shell=True, stdin=handle, stdout=subprocess.PIPE)
+    handle.close()
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    collapse_parser = commands.add_parser("collapse", help="collapse identical reads of a FASTQ file")
+    collapse_parser.add_argument("--input", required=True, help="read twice, so no pipe")
+    collapse_parser.add_argument("--decompress", default="cat", help="shell command decompressing stdin to stdout")
+    collapse_parser.add_argument("--umi", action="store_true", help="only collapse reads with the same UMI")
+    collapse_parser.add_argument("--name", default="")
+    collapse_parser.add_argument("--stats-out", help="TSV with the number of input and collapsed reads")
+
+    expand_parser = commands.add_parser("expand", help="expand collapsed reads of a BAM file")
+    expand_parser.add_argument("--input", required=True)
+    expand_parser.add_argument("--output", required=True)
+    expand_parser.add_argument("--threads", type=int, default=1)
+    expand_parser.add_argument("--index", action="store_true", help="also index the output")
+
+    log_parser = commands.add_parser("star-log", help="write the Log.final.out of all reads")
+    log_parser.add_argument("--log", required=True, help="Log.final.out of the collapsed reads")
+    log_parser.add_argument("--bam", required=True, help="BAM file of the collapsed reads")
+    log_parser.add_argument("--stats", required=True, help="--stats-out file of the collapse command")
+    log_parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    if args.command == "expand":
+        records, written = expand(args.input, args.output, max(args.threads, 1), args.index)
+        print(f"Expanded {records} collapsed alignments to {written}", file=sys.stderr)
+        return
+    if args.command == "star-log":
+        with open(args.log) as handle:
+            text = handle.read()
+        with open(args.output, "w") as handle:
+            handle.write(star_log(text, read_stats(args.stats), *mapped_reads(args.bam)))
+        return
+
+    processes = []
+    process = open_decompressed(args.input, args.decompress)
+    processes.append(process)
+    counts = count_keys(read_records(process.stdout), args.umi)
+    total = sum(counts.values())
+    process = open_decompressed(args.input, args.decompress)
+    processes.append(process)
+    written = collapse(read_records(process.stdout), counts, sys.stdout.buffer, args.umi)
+    sys.stdout.buffer.flush()
+    if any(process.wait() != 0 for process in processes):
+        sys.exit(f"Decompression failed for {args.input}")
+    if args.stats_out:
+        with open(args.stats_out, "w") as handle:
+            handle.write("sample\tinput_reads\tcollapsed_reads\n")
+            handle.write(f"{args.name or args.input}\t{total}\t{written}\n")
+    print(f"Collapsed {total} reads of {args.name or args.input} to {written} distinct reads", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""Crosslink sites of CLIP samples: a binary store per sample and the tracks derived from it.
+
+extract counts the crosslink sites of a coordinate-sorted BAM file. It is a
+streaming replacement of bedtools bamtobed, the chromosome boundary filter,
+bedtools shift -m 1 -p -1, sort and bedtools genomecov -bg -5: the crosslink
+site is 1 nt upstream of the read start (the alignment start on the plus
+strand, the alignment end on the minus strand) and reads starting at a
+chromosome end are left out.
+
+The reads are sorted by start, so a site is complete once the reads have
+moved past it; sites are counted in a window and written in order, without
+an intermediate BED file or sort.
+
+With --threads, chromosomes are read in parallel through the BAM index (built
+in the temporary directory if the BAM file has none). Small chromosomes and
+scaffolds are batched into jobs of about the same number of reads, so
+assemblies with many contigs do not start a job per contig.
+
+The sites are written to a crosslink store (see StoreWriter), from which the
+bedGraph files (neighbouring sites with equal counts joined and chromosomes
+sorted by name, LC_COLLATE=C, as genomecov | sort wrote them) and bigWig
+files are exported. bigWig files are written directly with pyBigWig (with
+zoom levels, like bedGraphToBigWig) instead of writing text and parsing it
+again. Loading a store is a memory map (see CrosslinkStore), e.g. in Python:
+
+    with CrosslinkStore("sample.xl") as store:
+        positions, counts = store.arrays("chr1", "plus")
+
+merge sums the stores of the samples of a group per nucleotide, like
+bigWigMerge, with a k-way merge, and exports the sum. export writes the
+tracks of an existing store. matrix joins the stores of all samples into a
+sparse sites x samples count matrix (see write_matrix) with the same k-way
+merge, so the memory used depends on the number of samples, not of sites.
+
+Needs pysam (extract) and pyBigWig (bigWig files).
+"""
+
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from collections import Counter
+from operator import itemgetter
+
+WINDOW = 1000
+# jobs per thread, so that the last jobs are small
+JOBS_PER_THREAD = 4
+# as bedGraphToBigWig
+ZOOM_LEVELS = 10
+# runs per pyBigWig addEntries call
+BIGWIG_CHUNK = 100000
+# matrix rows written at once, and their gzip level (as the fastq.gz files)
+MATRIX_CHUNK = 100000
+MATRIX_COMPRESSION = 6
+
+STRANDS = ("plus", "minus")
+# positions and counts are unsigned 32-bit integers (BAM positions are < 2^31)
+SITE_TYPE = "I"
+STORE_MAGIC = b"RCXLINK1"
+STORE_VERSION = 1
+
+
+def crosslink_site(read, length):
+    """0-based crosslink position 1 nt upstream of the read start.
+
+    None if the read starts at the end of the chromosome (length), where there
+    is no upstream nucleotide.
+    """
+    if read.is_reverse:
+        end = read.reference_end
+        return None if end == length else end
+    start = read.reference_start
+    return None if start == 0 else start - 1
+
+
+def name_key(name):
+    """Sort key of chromosome names in LC_COLLATE=C order."""
+    return name.encode()
+
+
+class Sites:
+    """Sorted crosslink positions of one strand of a chromosome and their counts."""
+
+    def __init__(self, positions=None, counts=None):
+        self.positions = array(SITE_TYPE) if positions is None else positions
+        self.counts = array(SITE_TYPE) if counts is None else counts
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, position, count):
+        self.positions.append(position)
+        self.counts.append(count)
+
+    def runs(self):
+        """(start, end, count) of the sites, neighbouring sites with equal counts joined."""
+        start = end = count = None
+        for position, value in zip(self.positions, self.counts):
+            if position == end and value == count:
+                end += 1
+                continue
+            if count is not None:
+                yield start, end, count
+            start, end, count = position, position + 1, value
+        if count is not None:
+            yield start, end, count
+
+
+def count_sites(counts):
+    """Sites of crosslink counts ({position: count}) of one strand."""
+    sites = Sites()
+    for position in sorted(counts):
+        sites.add(position, counts[position])
+    return sites
+
+
+def save_part(path, strands):
+    """Write the sites of both strands of one chromosome to a temporary part file."""
+    with open(path, "wb") as handle:
+        for sites in strands:
+            array("q", [len(sites)]).tofile(handle)
+            sites.positions.tofile(handle)
+            sites.counts.tofile(handle)
+
+
+def load_part(path):
+    strands = []
+    with open(path, "rb") as handle:
+        for _ in STRANDS:
+            size = array("q")
+            size.fromfile(handle, 1)
+            sites = Sites()
+            sites.positions.fromfile(handle, size[0])
+            sites.counts.fromfile(handle, size[0])
+            strands.append(sites)
+    return strands
+
+
+class StoreWriter:
+    """Writes a crosslink store; chromosomes can be written in any order.
+
+    Layout: STORE_MAGIC (8 bytes), the length of the JSON header (8 bytes,
+    little endian), the JSON header, zero padding to a multiple of 8 bytes,
+    then the data. The header has the byte order and item size of the arrays
+    and lists all chromosomes of the genome in name order with their length
+    and, per strand, the number of sites and the offset (from the start of
+    the data) of the sorted 0-based positions, which are followed by their
+    counts.
+    """
+
+    def __init__(self, path, chrom_sizes):
+        self.path = path
+        self.chrom_sizes = [(name, int(length)) for name, length in chrom_sizes]
+        self.strands = {}
+        self.size = 0
+        self.body = tempfile.NamedTemporaryFile(
+            prefix=os.path.basename(path) + ".", dir=os.path.dirname(os.path.abspath(path)), delete=False)
+
+    def write(self, contig, strands):
+        entries = {}
+        for strand, sites in zip(STRANDS, strands):
+            entries[strand] = {"offset": self.size, "sites": len(sites)}
+            sites.positions.tofile(self.body)
+            sites.counts.tofile(self.body)
+            self.size += 2 * len(sites) * sites.positions.itemsize
+        self.strands[contig] = entries
+
+    def close(self):
+        self.body.close()
+        empty = {strand: {"offset": 0, "sites": 0} for strand in STRANDS}
+        header = {
+            "format": "racoon_clip crosslinks",
+            "version": STORE_VERSION,
+            "byteorder": sys.byteorder,
+            "itemsize": array(SITE_TYPE).itemsize,
+            "chromosomes": [
+                {"name": name, "length": length, **self.strands.get(name, empty)}
+                for name, length in sorted(self.chrom_sizes, key=lambda item: name_key(item[0]))
+            ],
+        }
+        text = json.dumps(header).encode()
+        padding = -(16 + len(text)) % 8
+        try:
+            with open(self.path, "wb") as target:
+                target.write(STORE_MAGIC + struct.pack("<Q", len(text)) + text + b"\0" * padding)
+                with open(self.body.name, "rb") as body:
+                    shutil.copyfileobj(body, target)
+        finally:
+            os.remove(self.body.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.body.close()
+            os.remove(self.body.name)
+
+
+class CrosslinkStore:
+    """Memory-mapped crosslink store (see StoreWriter)."""
+
+    def __init__(self, path):
+        with open(path, "rb") as handle:
+            self.map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:8] != STORE_MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a crosslink store")
+        (size,) = struct.unpack("<Q", self.map[8:16])
+        header = json.loads(self.map[16:16 + size])
+        if header["byteorder"] != sys.byteorder or header["itemsize"] != array(SITE_TYPE).itemsize:
+            self.map.close()
+            raise ValueError(f"{path} was written on a machine with other integer types")
+        self.data = 16 + size + -(16 + size) % 8
+        self.entries = {entry["name"]: entry for entry in header["chromosomes"]}
+        # (name, length) in name order
+        self.chromosomes = [(entry["name"], entry["length"]) for entry in header["chromosomes"]]
+
+    def arrays(self, contig, strand):
+        """(positions, counts) of a strand of a chromosome as memoryviews of the mapped file.
+
+        numpy.frombuffer(view, dtype=numpy.uint32) reads them without a copy.
+        """
+        entry = self.entries[contig][strand]
+        length = entry["sites"] * array(SITE_TYPE).itemsize
+        start = self.data + entry["offset"]
+        view = memoryview(self.map)
+        return view[start:start + length].cast(SITE_TYPE), view[start + length:start + 2 * length].cast(SITE_TYPE)
+
+    def sites(self, contig, strand):
+        return Sites(*self.arrays(contig, strand))
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # arrays still in use; unmapped once they are released
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_bedgraph(handle, contig, sites):
+    for start, end, count in sites.runs():
+        handle.write(f"{contig}\t{start}\t{end}\t{count}\n")
+
+
+class TrackWriter:
+    """Writes the plus and minus strand tracks as bedGraph and/or bigWig files.
+
+    Chromosomes have to be written in name order; chrom_sizes are the
+    (name, length) pairs of the genome for the bigWig headers.
+    """
+
+    def __init__(self, bedgraphs=None, bigwigs=None, chrom_sizes=()):
+        self.bedgraphs = [open(path, "w") for path in bedgraphs or ()]
+        self.bigwigs = []
+        if bigwigs:
+            import pyBigWig
+
+            header = sorted(((name, int(length)) for name, length in chrom_sizes), key=lambda item: name_key(item[0]))
+            for path in bigwigs:
+                bigwig = pyBigWig.open(path, "w")
+                bigwig.addHeader(header, maxZooms=ZOOM_LEVELS)
+                self.bigwigs.append(bigwig)
+
+    def write(self, contig, strands):
+        for handle, sites in zip(self.bedgraphs, strands):
+            write_bedgraph(handle, contig, sites)
+        for bigwig, sites in zip(self.bigwigs, strands):
+            runs = sites.runs()
+            while True:
+                chunk = list(itertools.islice(runs, BIGWIG_CHUNK))
+                if not chunk:
+                    break
+                starts, ends, counts = zip(*chunk)
+                bigwig.addEntries([contig] * len(chunk), list(starts), ends=list(ends),
+                                  values=[float(count) for count in counts])
+
+    def close(self):
+        for handle in self.bedgraphs + self.bigwigs:
+            handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_store(store, bedgraphs=None, bigwigs=None):
+    """Write the tracks of an open CrosslinkStore; bedgraphs and bigwigs are (plus, minus) paths."""
+    with TrackWriter(bedgraphs, bigwigs, store.chromosomes) as writer:
+        for contig, _ in store.chromosomes:
+            strands = [store.sites(contig, strand) for strand in STRANDS]
+            if any(strands):
+                writer.write(contig, strands)
+
+
+def count_contig(reads, length, plus, minus, window=WINDOW):
+    """Count the crosslink sites of the sorted reads of one chromosome; returns (reads, sites).
+
+    The sites are added to plus and minus, the Sites of the two strands.
+    """
+    pending = ((Counter(), plus), (Counter(), minus))
+    flushed = None
+    used = sites = 0
+
+    def flush(limit):
+        for counts, strand in pending:
+            for position in sorted(position for position in counts if position < limit):
+                strand.add(position, counts.pop(position))
+
+    for read in reads:
+        if read.is_unmapped:
+            continue
+        used += 1
+        start = read.reference_start
+        # later reads have sites >= start - 1
+        if flushed is None or start > flushed + window:
+            flush(start - 1)
+            flushed = start
+        site = crosslink_site(read, length)
+        if site is not None:
+            pending[read.is_reverse][0][site] += 1
+            sites += 1
+    flush(float("inf"))
+    return used, sites
+
+
+def plan_jobs(contigs, threads):
+    """Batches of contigs ((name, mapped reads) in header order) of about equal read numbers.
+
+    Contigs with at least the average reads of a job are a job of their own;
+    the others are batched in header order. Largest jobs first.
+    """
+    contigs = [(name, mapped) for name, mapped in contigs if mapped]
+    target = sum(mapped for _, mapped in contigs) / max(threads * JOBS_PER_THREAD, 1)
+    jobs, batch, batch_reads = [], [], 0
+    for name, mapped in contigs:
+        if mapped >= target:
+            jobs.append(([name], mapped))
+            continue
+        batch.append(name)
+        batch_reads += mapped
+        if batch_reads >= target:
+            jobs.append((batch, batch_reads))
+            batch, batch_reads = [], 0
+    if batch:
+        jobs.append((batch, batch_reads))
+    return [names for names, _ in sorted(jobs, key=lambda job: -job[1])]
+
+
+def extract_contigs(job):
+    """Write the sites of some contigs to their part files; returns (reads, sites)."""
+    import pysam
+
+    input_bam, index, contigs = job
+    used = sites = 0
+    with pysam.AlignmentFile(input_bam, "rb", index_filename=index) as source:
+        for contig, path in contigs:
+            plus, minus = Sites(), Sites()
+            counts = count_contig(source.fetch(contig), source.get_reference_length(contig), plus, minus)
+            save_part(path, (plus, minus))
+            used += counts[0]
+            sites += counts[1]
+    return used, sites
+
+
+def extract_parallel(input_bam, store, threads, work_dir):
+    """extract_crosslinks with chromosomes in parallel through the BAM index."""
+    import pysam
+
+    with pysam.AlignmentFile(input_bam, "rb") as source:
+        index = None
+        if not source.has_index():
+            index = os.path.join(work_dir, "input.bai")
+            pysam.index("-@", str(threads), input_bam, index)
+    with pysam.AlignmentFile(input_bam, "rb", index_filename=index) as source:
+        names = list(source.references)
+        contigs = [(item.contig, item.mapped) for item in source.get_index_statistics()]
+    parts = {name: os.path.join(work_dir, f"{number}.sites") for number, name in enumerate(names)}
+    jobs = [(input_bam, index, [(name, parts[name]) for name in batch]) for batch in plan_jobs(contigs, threads)]
+    if len(jobs) > 1:
+        with multiprocessing.Pool(min(threads, len(jobs))) as pool:
+            results = list(pool.imap_unordered(extract_contigs, jobs))
+    else:
+        results = [extract_contigs(job) for job in jobs]
+    for _, _, batch in jobs:
+        for name, path in batch:
+            store.write(name, load_part(path))
+    return sum(used for used, _ in results), sum(sites for _, sites in results)
+
+
+def extract_crosslinks(input_bam, store_path, tmp_dir=None, threads=1):
+    """Count the crosslink sites of a coordinate-sorted BAM file into a store; returns (reads, sites)."""
+    import pysam
+
+    with pysam.AlignmentFile(input_bam, "rb") as source:
+        chrom_sizes = list(zip(source.references, source.lengths))
+    with StoreWriter(store_path, chrom_sizes) as store:
+        if threads > 1:
+            work_dir = tempfile.mkdtemp(prefix="crosslinks.", dir=tmp_dir or os.path.dirname(os.path.abspath(store_path)))
+            try:
+                return extract_parallel(input_bam, store, threads, work_dir)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        used = sites = 0
+        with pysam.AlignmentFile(input_bam, "rb") as source:
+            contigs = itertools.groupby(source.fetch(until_eof=True), key=lambda read: read.reference_id)
+            for reference_id, reads in contigs:
+                if reference_id < 0:
+                    break  # unplaced unmapped reads at the end
+                contig = source.get_reference_name(reference_id)
+                plus, minus = Sites(), Sites()
+                counts = count_contig(reads, source.get_reference_length(contig), plus, minus)
+                store.write(contig, (plus, minus))
+                used += counts[0]
+                sites += counts[1]
+        return used, sites
+
+
+def merge_sites(tracks):
+    """Sum of the counts of several Sites per position (k-way merge)."""
+    merged = Sites()
+    sites = heapq.merge(*(zip(track.positions, track.counts) for track in tracks))
+    for position, group in itertools.groupby(sites, key=itemgetter(0)):
+        merged.add(position, sum(count for _, count in group))
+    return merged
+
+
+def open_stores(inputs):
+    """Open crosslink stores of the same genome."""
+    stores = [CrosslinkStore(path) for path in inputs]
+    for path, store in zip(inputs[1:], stores[1:]):
+        if store.chromosomes != stores[0].chromosomes:
+            for opened in stores:
+                opened.close()
+            raise ValueError(f"{path} has other chromosomes than {inputs[0]}")
+    return stores
+
+
+def merge_stores(inputs, bedgraphs=None, bigwigs=None):
+    """Write the summed tracks of several stores of the same genome; returns the chromosomes with sites."""
+    stores = open_stores(inputs)
+    try:
+        chromosomes = stores[0].chromosomes
+        written = 0
+        with TrackWriter(bedgraphs, bigwigs, chromosomes) as writer:
+            for contig, _ in chromosomes:
+                strands = [merge_sites([store.sites(contig, strand) for store in stores]) for strand in STRANDS]
+                if any(strands):
+                    writer.write(contig, strands)
+                    written += 1
+        return written
+    finally:
+        for store in stores:
+            store.close()
+
+
+def matrix_rows(stores):
+    """(contig, position, strand, [(column, count)]) of the sites of any store, sorted.
+
+    Rows are sorted by chromosome name, position and strand (plus first),
+    the counts of a row by column (the index of the store).
+    """
+    for contig, _ in stores[0].chromosomes:
+        tracks = []
+        for column, store in enumerate(stores):
+            for strand, name in enumerate(STRANDS):
+                positions, counts = store.arrays(contig, name)
+                tracks.append(zip(positions, itertools.repeat(strand), itertools.repeat(column), counts))
+        for (position, strand), entries in itertools.groupby(heapq.merge(*tracks), key=itemgetter(0, 1)):
+            yield contig, position, STRANDS[strand], [(column, count) for _, _, column, count in entries]
+
+
+def write_matrix(inputs, samples, matrix, sites, columns):
+    """Write the crosslink counts of the stores of all samples as a sparse matrix; returns (rows, entries).
+
+    matrix is a gzipped Matrix Market coordinate file (integer, 1-based, as
+    read by scipy.io.mmread or Matrix::readMM) with one row per crosslink
+    site and one column per sample. sites is the gzipped row index (contig,
+    0-based position, strand per line), columns the column index (one sample
+    name per line).
+    """
+    if len(samples) != len(inputs):
+        raise ValueError(f"{len(samples)} sample names for {len(inputs)} crosslink stores")
+    with open(columns, "w") as handle:
+        handle.writelines(f"{sample}\n" for sample in samples)
+    stores = open_stores(inputs)
+    site_rows = matrix_rows(stores)
+    # the size line comes before the entries, so they go to a second gzip member first
+    body = tempfile.NamedTemporaryFile(prefix=os.path.basename(matrix) + ".",
+                                       dir=os.path.dirname(os.path.abspath(matrix)), delete=False)
+    rows = entries = 0
+    try:
+        with gzip.open(body, "wt", compresslevel=MATRIX_COMPRESSION) as values, \
+                gzip.open(sites, "wt", compresslevel=MATRIX_COMPRESSION) as index:
+            for chunk in iter(lambda: list(itertools.islice(site_rows, MATRIX_CHUNK)), []):
+                lines = []
+                for row, (contig, position, strand, counts) in enumerate(chunk, rows + 1):
+                    lines.extend(f"{row} {column + 1} {count}\n" for column, count in counts)
+                index.writelines(f"{contig}\t{position}\t{strand}\n" for contig, position, strand, _ in chunk)
+                values.writelines(lines)
+                rows += len(chunk)
+                entries += len(lines)
+        body.close()
+        with open(matrix, "wb") as target:
+            header = f"%%MatrixMarket matrix coordinate integer general\n{rows} {len(samples)} {entries}\n"
+            target.write(gzip.compress(header.encode()))
+            with open(body.name, "rb") as values:
+                shutil.copyfileobj(values, target)
+    finally:
+        body.close()
+        os.remove(body.name)
+        for store in stores:
+            store.close()
+    return rows, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    extract = commands.add_parser("extract", help="crosslink store of a coordinate-sorted BAM file")
+    extract.add_argument("--input", required=True, help="coordinate-sorted BAM file")
+    extract.add_argument("--store", required=True)
+    extract.add_argument("--threads", type=int, default=1)
+    extract.add_argument("--tmp-dir", help="directory of the per-chromosome files (default: next to the store)")
+    export = commands.add_parser("export", help="tracks of a crosslink store")
+    export.add_argument("--store", required=True)
+    merge = commands.add_parser("merge", help="summed tracks of several crosslink stores")
+    merge.add_argument("--inputs", nargs="+", required=True, help="crosslink stores of the same genome")
+    matrix = commands.add_parser("matrix", help="sparse sites x samples matrix of several crosslink stores")
+    matrix.add_argument("--inputs", nargs="+", required=True, help="crosslink stores of the same genome")
+    matrix.add_argument("--samples", nargs="+", required=True, help="column names, one per store")
+    matrix.add_argument("--matrix", required=True, help="Matrix Market file (.mtx.gz)")
+    matrix.add_argument("--sites", required=True, help="row index (.tsv.gz)")
+    matrix.add_argument("--columns", required=True, help="column index (.tsv)")
+    for command in (extract, export, merge):
+        command.add_argument("--bedgraph", nargs=2, metavar=("PLUS", "MINUS"), help="write bedGraph files")
+        command.add_argument("--bigwig", nargs=2, metavar=("PLUS", "MINUS"), help="write bigWig files")
+    args = parser.parse_args()
+
+    if args.command == "matrix":
+        rows, entries = write_matrix(args.inputs, args.samples, args.matrix, args.sites, args.columns)
+        print(f"Wrote {entries} counts of {rows} crosslink sites in {len(args.inputs)} samples", file=sys.stderr)
+        return
+    if args.command == "merge":
+        written = merge_stores(args.inputs, args.bedgraph, args.bigwig)
+        print(f"Merged {len(args.inputs)} samples on {written} chromosomes", file=sys.stderr)
+        return
+    if args.command == "extract":
+        used, sites = extract_crosslinks(args.input, args.store, args.tmp_dir, max(args.threads, 1))
+        print(f"Extracted {sites} crosslink sites from {used} reads", file=sys.stderr)
+    with CrosslinkStore(args.store) as store:
+        export_store(store, args.bedgraph, args.bigwig)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""UMI deduplication of coordinate-sorted single-end BAM files, per chromosome.
+
+Native alternative to umi_tools dedup --extract-umi-method read_id --method
+unique: reads are duplicates if they have the same strand, 5' position and
+UMI (the part of the read ID after the last "_"). As in umi_tools, the 5'
+position includes soft-clipped bases and is the alignment end for reverse
+reads. Of every group of duplicates the read with the highest mapping quality
+is kept; of equal ones the first (umi_tools picks one at random).
+
+With --method directional, UMIs at one position that differ by one base are
+merged as in umi_tools' directional method: UMI a absorbs UMI b if
+count(a) >= 2 * count(b) - 1, and the reads of every UMI reachable from the
+most frequent remaining UMI count as duplicates of its read. Neighbouring
+UMIs are found by hashing every UMI with each position masked, so only UMIs
+in the same bucket are compared instead of all pairs (positions with only a
+few UMIs, where that is cheaper, compare all pairs).
+
+The sorted reads are streamed through a window: a group is complete once the
+reads have moved WINDOW bases past its position (the same rule as umi_tools),
+and the kept reads are written in input order, so the output stays sorted.
+Chromosomes are deduplicated in parallel via the BAM index, each into its own
+temporary BAM file, and concatenated in header order.
+
+With --collapsed, the reads are the collapsed reads of collapse_reads.py: a
+read named "x<count>:<ID>" counts as <count> reads, in the log and for the
+directional method, and is written with the prefix removed, as if all reads
+had been aligned and deduplicated.
+
+With --crosslinks, the crosslink sites of the kept reads are counted in the
+same pass and written to a crosslink store, with --bedgraph and --bigwig also
+as plus and minus strand tracks, as crosslinks.py writes them.
+
+The log has the layout of a umi_tools dedup log, so the reports read it in the
+same way. Needs pysam.
+"""
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import Counter, defaultdict, deque
+
+from crosslinks import CrosslinkStore, StoreWriter, count_sites, crosslink_site, export_store, load_part, save_part
+
+SOFT_CLIP = 4
+WINDOW = 1000
+METHODS = ("unique", "directional")
+# read name prefix of collapse_reads.py
+COUNT_PREFIX = re.compile(r"^x(\d+):")
+
+# options umi_tools writes to the head of its log, in its order, with its
+# defaults
+LOG_OPTIONS = (
+    ("assigned_tag", "None"),
+    ("cell_tag", "None"),
+    ("cell_tag_delim", "None"),
+    ("cell_tag_split", "-"),
+    ("chimeric_pairs", "use"),
+    ("chrom", "None"),
+    ("compresslevel", "6"),
+    ("detection_method", "None"),
+    ("filter_umi", "None"),
+    ("gene_tag", "None"),
+    ("gene_transcript_map", "None"),
+    ("get_umi_method", "read_id"),
+    ("ignore_tlen", "False"),
+    ("ignore_umi", "False"),
+    ("in_sam", "False"),
+    ("log2stderr", "False"),
+    ("loglevel", "1"),
+    ("mapping_quality", "0"),
+    ("method", "unique"),
+    ("no_sort_output", "False"),
+    ("out_sam", "False"),
+    ("output_unmapped", "False"),
+    ("paired", "False"),
+    ("per_cell", "False"),
+    ("per_contig", "False"),
+    ("per_gene", "False"),
+    ("random_seed", "None"),
+    ("read_length", "False"),
+    ("short_help", "None"),
+    ("skip_regex", "^(__|Unassigned)"),
+    ("soft_clip_threshold", "4"),
+    ("spliced", "False"),
+    ("stats", "False"),
+    ("stderr", "None"),
+    ("stdin", "None"),
+    ("stdlog", "None"),
+    ("stdout", "None"),
+    ("subset", "None"),
+    ("threshold", "1"),
+    ("timeit_file", "None"),
+    ("timeit_header", "None"),
+    ("timeit_name", "all"),
+    ("tmpdir", "None"),
+    ("umi_sep", "_"),
+    ("umi_tag", "RX"),
+    ("umi_tag_delim", "None"),
+    ("umi_tag_split", "None"),
+    ("umi_whitelist", "None"),
+    ("umi_whitelist_paired", "None"),
+    ("unmapped_reads", "discard"),
+    ("unpaired_reads", "use"),
+    ("whole_contig", "False"),
+)
+
+
+class DedupStats:
+    """Read and position counts in the terms of the umi_tools log."""
+
+    def __init__(self):
+        self.events = Counter()
+        self.reads_out = 0
+        self.positions = 0
+        self.umis = 0
+        self.max_umis = 0
+
+    def add_group(self, umis):
+        self.positions += 1
+        self.umis += umis
+        self.max_umis = max(self.max_umis, umis)
+
+    def update(self, other):
+        self.events.update(other.events)
+        self.reads_out += other.reads_out
+        self.positions += other.positions
+        self.umis += other.umis
+        self.max_umis = max(self.max_umis, other.max_umis)
+
+
+def read_position(read):
+    """5' position of a read as umi_tools defines it (soft clips included)."""
+    cigar = read.cigartuples
+    if read.is_reverse:
+        position = read.reference_end
+        if cigar[-1][0] == SOFT_CLIP:
+            position += cigar[-1][1]
+    else:
+        position = read.reference_start
+        if cigar[0][0] == SOFT_CLIP:
+            position -= cigar[0][1]
+    return position
+
+
+def read_umi(name, separator="_"):
+    return name.rpartition(separator)[2]
+
+
+def collapsed_count(read):
+    """Number of reads a collapsed read stands for; removes the prefix from its name."""
+    match = COUNT_PREFIX.match(read.query_name)
+    if match is None:
+        return 1
+    read.query_name = read.query_name[match.end():]
+    return int(match.group(1))
+
+
+def hamming_neighbours(umis):
+    """Pairs of UMIs that differ at exactly one position.
+
+    Every UMI is put into one bucket per position, keyed by the UMI with that
+    position masked; two different UMIs share a bucket only if they differ at
+    exactly the masked position.
+    """
+    buckets = defaultdict(list)
+    for umi in umis:
+        for position in range(len(umi)):
+            buckets[(position, umi[:position], umi[position + 1:])].append(umi)
+    for bucket in buckets.values():
+        for first in range(len(bucket)):
+            for second in range(first + 1, len(bucket)):
+                yield bucket[first], bucket[second]
+
+
+def one_mismatch(first, second):
+    """Whether two UMIs have the same length and differ at exactly one position."""
+    if len(first) != len(second):
+        return False
+    mismatches = 0
+    for a, b in zip(first, second):
+        if a != b:
+            mismatches += 1
+            if mismatches > 1:
+                return False
+    return mismatches == 1
+
+
+def directional_heads(counts):
+    """UMIs whose reads are kept by the directional method.
+
+    counts maps UMIs to read counts, in the order the UMIs were seen (which
+    breaks ties between equal counts).
+    """
+    umis = list(counts)
+    if len(umis) - 1 <= 2 * len(umis[0]):
+        # fewer pairs than bucket keys: comparing all pairs is cheaper
+        pairs = (
+            (first, second)
+            for number, first in enumerate(umis)
+            for second in umis[number + 1:]
+            if one_mismatch(first, second)
+        )
+    else:
+        pairs = hamming_neighbours(umis)
+    graph = {umi: [] for umi in umis}
+    for first, second in pairs:
+        if counts[first] >= 2 * counts[second] - 1:
+            graph[first].append(second)
+        if counts[second] >= 2 * counts[first] - 1:
+            graph[second].append(first)
+    heads = []
+    found = set()
+    for umi in sorted(counts, key=counts.get, reverse=True):
+        if umi in found:
+            continue
+        heads.append(umi)
+        # like umi_tools, the search also passes UMIs of earlier clusters
+        searched = {umi}
+        queue = [umi]
+        while queue:
+            for neighbour in graph[queue.pop()]:
+                if neighbour not in searched:
+                    searched.add(neighbour)
+                    queue.append(neighbour)
+        found.update(searched)
+    return heads
+
+
+def deduplicate(reads, stats, window=WINDOW, method="unique", collapsed=False):
+    """Yield the reads to keep of a coordinate-sorted stream of one chromosome."""
+    pending = deque()  # [position, read, keep] in input order
+    groups = {}  # (strand, position) -> {UMI: [pending entry of the kept read, reads]}
+    flushed = None
+
+    def complete(limit):
+        for key in [key for key in groups if key[1] <= limit]:
+            umis = groups.pop(key)
+            stats.add_group(len(umis))
+            if method == "directional" and len(umis) > 1:
+                heads = set(directional_heads({umi: count for umi, (_, count) in umis.items()}))
+                for umi, (entry, _) in umis.items():
+                    if umi not in heads:
+                        entry[2] = False
+        while pending and pending[0][0] <= limit:
+            _, read, keep = pending.popleft()
+            if keep:
+                stats.reads_out += 1
+                yield read
+
+    for read in reads:
+        count = collapsed_count(read) if collapsed else 1
+        if read.is_unmapped:
+            stats.events["Single end unmapped"] += count
+            continue
+        stats.events["Input Reads"] += count
+        start = read.reference_start
+        if flushed is None or start > flushed + window:
+            yield from complete(start - window)
+            flushed = start
+        position = read_position(read)
+        entry = [position, read, True]
+        group = groups.setdefault((read.is_reverse, position), {})
+        umi = read_umi(read.query_name)
+        kept = group.get(umi)
+        if kept is None:
+            group[umi] = [entry, count]
+            pending.append(entry)
+            continue
+        kept[1] += count
+        if read.mapping_quality > kept[0][1].mapping_quality:
+            kept[0][2] = False
+            kept[0] = entry
+        else:
+            entry[2] = False
+        pending.append(entry)
+    yield from complete(float("inf"))
+
+
+def deduplicate_contig(job):
+    """Deduplicate one chromosome of input_bam into output_bam; returns (contig, stats).
+
+    If sites_part is a path, the crosslink sites of the kept reads are saved
+    to it.
+    """
+    import pysam
+
+    input_bam, contig, output_bam, method, collapsed, sites_part = job
+    stats = DedupStats()
+    plus, minus = Counter(), Counter()
+    with pysam.AlignmentFile(input_bam, "rb") as source:
+        length = source.get_reference_length(contig)
+        with pysam.AlignmentFile(output_bam, "wb", template=source) as target:
+            for read in deduplicate(source.fetch(contig), stats, method=method, collapsed=collapsed):
+                target.write(read)
+                if sites_part:
+                    site = crosslink_site(read, length)
+                    if site is not None:
+                        (minus if read.is_reverse else plus)[site] += 1
+    if sites_part:
+        save_part(sites_part, (count_sites(plus), count_sites(minus)))
+    return contig, stats
+
+
+def deduplicate_bam(input_bam, output_bam, threads=1, tmp_dir=None, method="unique", crosslinks=None,
+                    bedgraphs=None, bigwigs=None, collapsed=False):
+    """Deduplicate all chromosomes of an indexed BAM file; returns the stats.
+
+    crosslinks is an optional crosslink store path for the crosslink sites of
+    the kept reads, exported to the (plus, minus) bedgraphs and bigwigs paths.
+    """
+    import pysam
+
+    with pysam.AlignmentFile(input_bam, "rb") as source:
+        contigs = [(item.contig, item.mapped) for item in source.get_index_statistics()]
+        chrom_sizes = list(zip(source.references, source.lengths))
+        unplaced = source.unmapped
+    stats = DedupStats()
+    if unplaced:
+        stats.events["Single end unmapped"] += unplaced
+    work_dir = tempfile.mkdtemp(prefix="dedup_umi.", dir=tmp_dir or os.path.dirname(os.path.abspath(output_bam)))
+    try:
+        parts = {
+            contig: os.path.join(work_dir, f"{number}.bam")
+            for number, (contig, mapped) in enumerate(contigs) if mapped
+        }
+        sites_parts = {contig: f"{path[:-4]}.sites" if crosslinks else None for contig, path in parts.items()}
+        # largest chromosomes first, so no worker is left with a big one at the end
+        jobs = [
+            (input_bam, contig, parts[contig], method, collapsed, sites_parts[contig])
+            for contig, _ in sorted(contigs, key=lambda item: -item[1]) if contig in parts
+        ]
+        if threads > 1 and len(jobs) > 1:
+            with multiprocessing.Pool(min(threads, len(jobs))) as pool:
+                results = list(pool.imap_unordered(deduplicate_contig, jobs))
+        else:
+            results = [deduplicate_contig(job) for job in jobs]
+        for _, contig_stats in results:
+            stats.update(contig_stats)
+        files = [parts[contig] for contig, _ in contigs if contig in parts]
+        if not files:
+            with pysam.AlignmentFile(input_bam, "rb") as source:
+                pysam.AlignmentFile(output_bam, "wb", template=source).close()
+        elif len(files) == 1:
+            shutil.move(files[0], output_bam)
+        else:
+            pysam.cat("-o", output_bam, *files)
+        if crosslinks:
+            with StoreWriter(crosslinks, chrom_sizes) as store:
+                for contig, path in sites_parts.items():
+                    store.write(contig, load_part(path))
+            with CrosslinkStore(crosslinks) as store:
+                export_store(store, bedgraphs, bigwigs)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    stats.events.setdefault("Input Reads", 0)
+    return stats
+
+
+def log_time(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S,") + f"{moment.microsecond // 1000:03d}"
+
+
+def write_log(path, command, stats, started, options):
+    """Write the log in the layout of umi_tools dedup (header, command, statistics)."""
+    now = datetime.datetime.now()
+    lines = [
+        "# racoon_clip dedup_umi.py (log in the layout of UMI-tools dedup)",
+        f"# output generated by {command}",
+        f"# job started at {started.ctime()} on {os.uname().nodename}",
+        f"# pid: {os.getpid()}, system: {' '.join(os.uname()[:1] + os.uname()[2:])}",
+    ]
+    lines += [f"# {name:<40}: {options.get(name, default)}" for name, default in LOG_OPTIONS]
+    lines.append(f"{log_time(started)} INFO command: {command}")
+    events = ", ".join(f"{name}: {count}" for name, count in stats.events.most_common())
+    lines.append(f"{log_time(now)} INFO Reads: {events}")
+    lines.append(f"{log_time(now)} INFO Number of reads out: {stats.reads_out}")
+    lines.append(f"{log_time(now)} INFO Total number of positions deduplicated: {stats.positions}")
+    if stats.positions > 0:
+        lines.append(f"{log_time(now)} INFO Mean number of unique UMIs per position: {stats.umis / stats.positions:.2f}")
+        lines.append(f"{log_time(now)} INFO Max. number of unique UMIs per position: {stats.max_umis}")
+    else:
+        lines.append(f"{log_time(now)} WARNING The BAM did not contain any valid reads/read pairs for deduplication")
+    seconds = int((now - started).total_seconds())
+    lines.append(f"# job finished in {seconds} seconds at {now.ctime()}")
+    with open(path, "w") as handle:
+        handle.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # -I/-S/-L as for umi_tools dedup
+    parser.add_argument("-I", "--input", required=True, help="coordinate-sorted, indexed BAM file")
+    parser.add_argument("-S", "--output", required=True)
+    parser.add_argument("-L", "--log", required=True)
+    parser.add_argument("--method", choices=METHODS, default="unique")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--collapsed", action="store_true",
+                        help="count reads named x<count>:<ID> (collapse_reads.py) <count> times")
+    parser.add_argument("--crosslinks", metavar="STORE",
+                        help="also write the crosslink sites of the kept reads to a crosslink store")
+    parser.add_argument("--bedgraph", nargs=2, metavar=("PLUS", "MINUS"),
+                        help="with --crosslinks, also write them as bedGraph files")
+    parser.add_argument("--bigwig", nargs=2, metavar=("PLUS", "MINUS"),
+                        help="with --crosslinks, also write them as bigWig files")
+    parser.add_argument("--tmp-dir", help="directory of the per-chromosome files (default: next to the output)")
+    args = parser.parse_args()
+
+    started = datetime.datetime.now()
+    stats = deduplicate_bam(args.input, args.output, max(args.threads, 1), args.tmp_dir, args.method, args.crosslinks,
+                           args.bedgraph, args.bigwig, args.collapsed)
+    options = {"method": args.method, "stdin": args.input, "stdout": args.output, "stdlog": args.log}
+    write_log(args.log, " ".join(["dedup_umi.py"] + sys.argv[1:]), stats, started, options)
+    print(f"Deduplicated {stats.events['Input Reads']} reads to {stats.reads_out} "
+          f"in {(datetime.datetime.now() - started).total_seconds():.0f} seconds", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
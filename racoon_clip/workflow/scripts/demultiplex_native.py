@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Demultiplex reads by their 5' barcode with a precomputed barcode hash index.
+
+Native alternative to flexbar --barcodes ... --barcode-trim-end LTAIL
+--umi-tags: the barcode must start at the first base of the read, N positions
+of the barcode are UMI positions, the other (experimental) positions must
+match within --mismatches substitutions. Matching reads lose the barcode
+region and get "_<UMI>" appended to their ID. Samples sharing a barcode all
+receive the read; reads that fit no barcode, or two different barcodes equally
+well, are unassigned.
+
+Every barcode variant within the allowed Hamming distance is precomputed, so
+assigning a read is one dictionary lookup. Chunks of reads are processed by a
+worker pool and written in input order.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import subprocess
+import sys
+
+BASES = b"ACGTN"
+AMBIGUOUS = -1
+CHUNK_RECORDS = 20000
+
+
+def read_barcodes(path):
+    """Return [(sample, barcode)] from a FASTA with one barcode per sample."""
+    barcodes = []
+    name = None
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                name = line[1:].split()[0]
+            elif name is None:
+                raise ValueError(f"{path}: sequence before the first FASTA header")
+            else:
+                barcodes.append((name, line.upper()))
+                name = None
+    return barcodes
+
+
+def runs(positions):
+    """Collapse sorted positions into (start, end) slices."""
+    slices = []
+    for position in positions:
+        if slices and slices[-1][1] == position:
+            slices[-1][1] += 1
+        else:
+            slices.append([position, position + 1])
+    return [tuple(item) for item in slices]
+
+
+class BarcodeIndex:
+    """Hash index from masked barcode variants to barcode ids.
+
+    Barcodes with the same layout (length and N positions) share one table;
+    identical barcodes of different samples share one id.
+    """
+
+    def __init__(self, barcodes, mismatches):
+        if mismatches < 0:
+            raise ValueError("The number of barcode mismatches must not be negative")
+        self.samples = [sample for sample, _ in barcodes]
+        sequences = list(dict.fromkeys(barcode for _, barcode in barcodes))
+        self.id_samples = [
+            [index for index, (_, barcode) in enumerate(barcodes) if barcode == sequence] for sequence in sequences
+        ]
+        layouts = {}
+        for barcode_id, sequence in enumerate(sequences):
+            fixed = tuple(position for position, base in enumerate(sequence) if base != "N")
+            layouts.setdefault((len(sequence), fixed), []).append(barcode_id)
+        self.layouts = []
+        for (length, fixed), barcode_ids in layouts.items():
+            table = {}
+            for barcode_id in barcode_ids:
+                sequence = sequences[barcode_id].encode()
+                key = bytes(sequence[position] for position in fixed)
+                for distance, variant in self._variants(key, mismatches):
+                    best = table.get(variant)
+                    if best is None or distance < best[0]:
+                        table[variant] = (distance, barcode_id)
+                    elif distance == best[0] and best[1] != barcode_id:
+                        table[variant] = (distance, AMBIGUOUS)
+            umi = tuple(position for position in range(length) if position not in fixed)
+            self.layouts.append((length, runs(fixed), runs(umi), table))
+
+    @staticmethod
+    def _variants(key, mismatches):
+        yield 0, key
+        for distance in range(1, min(mismatches, len(key)) + 1):
+            for positions in itertools.combinations(range(len(key)), distance):
+                choices = [[base for base in BASES if base != key[position]] for position in positions]
+                for substitution in itertools.product(*choices):
+                    variant = bytearray(key)
+                    for position, base in zip(positions, substitution):
+                        variant[position] = base
+                    yield distance, bytes(variant)
+
+    def assign(self, sequence):
+        """Return (barcode id or None, barcode length, UMI) for a sequence."""
+        best = None
+        for length, fixed, umi, table in self.layouts:
+            if len(sequence) < length:
+                continue
+            key = sequence[fixed[0][0]:fixed[0][1]] if len(fixed) == 1 else b"".join(
+                sequence[start:end] for start, end in fixed
+            )
+            hit = table.get(key)
+            if hit is None:
+                continue
+            if best is None or hit[0] < best[0]:
+                best = (hit[0], hit[1], length, umi)
+            elif hit[0] == best[0] and hit[1] != best[1]:
+                best = (hit[0], AMBIGUOUS, length, umi)
+        if best is None or best[1] == AMBIGUOUS:
+            return None, 0, b""
+        _, barcode_id, length, umi = best
+        return barcode_id, length, b"".join(sequence[start:end] for start, end in umi)
+
+
+def demultiplex_chunk(index, chunk):
+    """Route the records of a FASTQ chunk; returns (bytes per barcode id, unassigned bytes)."""
+    assigned = [[] for _ in index.id_samples]
+    unassigned = []
+    lines = chunk.splitlines(keepends=True)
+    for start in range(0, len(lines), 4):
+        header, sequence, plus, quality = lines[start:start + 4]
+        barcode_id, length, umi = index.assign(sequence.rstrip(b"\r\n"))
+        if barcode_id is None:
+            unassigned.append(header + sequence + plus + quality)
+            continue
+        if umi:
+            header = header.rstrip(b"\r\n") + b"_" + umi + b"\n"
+        assigned[barcode_id].append(header + sequence[length:] + plus + quality[length:])
+    return [b"".join(chunk) for chunk in assigned], b"".join(unassigned)
+
+
+_WORKER_INDEX = None
+
+
+def _init_worker(index):
+    global _WORKER_INDEX
+    _WORKER_INDEX = index
+
+
+def _work(chunk):
+    return demultiplex_chunk(_WORKER_INDEX, chunk)
+
+
+def chunks(source, size=CHUNK_RECORDS):
+    """Yield blocks of about `size` complete records as raw bytes.
+
+    Only lines are counted here, so the reading process stays ahead of the
+    workers that parse the records.
+    """
+    readline = source.readline
+    while True:
+        lines = list(itertools.islice(iter(readline, b""), size * 4))
+        if not lines:
+            return
+        if len(lines) % 4:
+            raise ValueError("Incomplete FASTQ record at end of input")
+        yield b"".join(lines)
+
+
+def demultiplex(source, index, outputs, unassigned=None, threads=1, chunk_records=CHUNK_RECORDS):
+    """Write every sample's reads to outputs[sample index]; returns read counts."""
+    counts = {"total": 0, "unassigned": 0, "assigned": [0] * len(index.samples)}
+    if threads > 1:
+        pool = multiprocessing.Pool(threads, initializer=_init_worker, initargs=(index,))
+        results = pool.imap(_work, chunks(source, chunk_records), chunksize=1)
+    else:
+        pool = None
+        results = (demultiplex_chunk(index, chunk) for chunk in chunks(source, chunk_records))
+    try:
+        for assigned, rest in results:
+            for barcode_id, data in enumerate(assigned):
+                if not data:
+                    continue
+                reads = data.count(b"\n") // 4
+                for sample in index.id_samples[barcode_id]:
+                    outputs[sample].write(data)
+                    counts["assigned"][sample] += reads
+                counts["total"] += reads
+            if rest:
+                reads = rest.count(b"\n") // 4
+                counts["unassigned"] += reads
+                counts["total"] += reads
+                if unassigned is not None:
+                    unassigned.write(rest)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="-")
+    parser.add_argument("--barcodes", required=True, help="FASTA with the barcode of every sample")
+    parser.add_argument("--samples", nargs="+", required=True)
+    parser.add_argument("--outputs", nargs="+", required=True, help="one output per sample, same order")
+    parser.add_argument("--unassigned")
+    parser.add_argument("--mismatches", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--compress", default="gzip -c", help="shell command compressing stdin to stdout")
+    args = parser.parse_args()
+
+    if len(args.samples) != len(args.outputs):
+        sys.exit("--samples and --outputs need the same number of entries")
+    barcodes = dict(read_barcodes(args.barcodes))
+    missing = [sample for sample in args.samples if sample not in barcodes]
+    if missing:
+        sys.exit(f"No barcode found in {args.barcodes} for: {', '.join(missing)}")
+    index = BarcodeIndex([(sample, barcodes[sample]) for sample in args.samples], args.mismatches)
+
+    paths = list(args.outputs) + ([args.unassigned] if args.unassigned else [])
+    processes = []
+    for path in paths:
+        with open(path, "wb") as handle:
+            processes.append(subprocess.Popen(args.compress, shell=True, stdin=subprocess.PIPE, stdout=handle))
+    handles = [process.stdin for process in processes]
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        counts = demultiplex(
+            source,
+            index,
+            handles[:len(args.outputs)],
+            handles[-1] if args.unassigned else None,
+            max(args.threads, 1),
+        )
+    finally:
+        for handle in handles:
+            handle.close()
+    failed = [path for path, process in zip(paths, processes) if process.wait() != 0]
+    if failed:
+        sys.exit(f"Compression failed for: {', '.join(failed)}")
+
+    print(f"Native demultiplexing of {counts['total']} reads "
+          f"(up to {args.mismatches} barcode mismatches):", file=sys.stderr)
+    for sample, reads in zip(args.samples, counts["assigned"]):
+        print(f"  {sample}: {reads}", file=sys.stderr)
+    print(f"  unassigned: {counts['unassigned']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
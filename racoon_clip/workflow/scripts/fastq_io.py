@@ -0,0 +1,120 @@
+"""Shared FASTQ streaming helpers for the racoon_clip workflow scripts."""
+
+import gzip
+import sys
+
+import numpy as np
+
+PHRED_OFFSETS = {"-Q33": 33, "-Q64": 64}
+CHUNK_BYTES = 1 << 22
+
+
+def phred_offset(seq_format):
+    """Return the ASCII quality offset for a fastx_toolkit style format flag."""
+    try:
+        return PHRED_OFFSETS[seq_format.strip()]
+    except KeyError:
+        raise ValueError(f"Unsupported seq_format {seq_format!r}; expected -Q33 or -Q64") from None
+
+
+def open_input(path):
+    """Open a plain or gzipped FASTQ for binary reading; '-' reads stdin."""
+    if path == "-":
+        return sys.stdin.buffer
+    with open(path, "rb") as handle:
+        magic = handle.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+
+def open_output(path):
+    """Open a binary output handle; '-' writes stdout."""
+    if path == "-":
+        return sys.stdout.buffer
+    return gzip.open(path, "wb") if str(path).endswith(".gz") else open(path, "wb")
+
+
+def read_records(handle):
+    """Yield (header, sequence, plus, quality) lines, newlines included."""
+    readline = handle.readline
+    while True:
+        header = readline()
+        if not header:
+            return
+        sequence = readline()
+        plus = readline()
+        quality = readline()
+        if not quality:
+            raise ValueError("Incomplete FASTQ record at end of input")
+        yield header, sequence, plus, quality
+
+
+def read_chunks(handle, chunk_bytes=CHUNK_BYTES):
+    """Yield (data, line_ends) blocks of complete FASTQ records.
+
+    line_ends holds the position of the newline ending every line of data,
+    four per record. A missing newline at the end of the input is added.
+    """
+    rest = b""
+    while True:
+        block = handle.read(chunk_bytes)
+        data = rest + block
+        if not block:
+            if not data:
+                return
+            if not data.endswith(b"\n"):
+                data += b"\n"
+        line_ends = np.flatnonzero(np.frombuffer(data, np.uint8) == 10)
+        complete = len(line_ends) - len(line_ends) % 4
+        if not block and complete != len(line_ends):
+            raise ValueError("Incomplete FASTQ record at end of input")
+        if complete:
+            end = int(line_ends[complete - 1]) + 1
+            yield data[:end], line_ends[:complete]
+            rest = data[end:]
+        else:
+            rest = data
+        if not block:
+            return
+
+
+def line_starts(line_ends):
+    """Start positions of the lines ending at line_ends."""
+    starts = np.empty_like(line_ends)
+    starts[0:1] = 0
+    starts[1:] = line_ends[:-1] + 1
+    return starts
+
+
+def quality_pass(data, line_ends, region_length, threshold):
+    """True for every record of a chunk whose first region_length bases reach threshold.
+
+    Mirrors fastx_trimmer -l N | fastq_quality_filter -p 100: reads shorter
+    than the region are judged on the bases they have. Evaluated for all
+    records at once on a (records x region_length) array.
+    """
+    buffer = np.frombuffer(data, np.uint8)
+    starts = line_ends[2::4] + 1
+    ends = line_ends[3::4]
+    ends = ends - (buffer[np.maximum(ends - 1, 0)] == 13)
+    if region_length <= 0 or not len(ends):
+        return np.ones(len(ends), dtype=bool)
+    lengths = np.minimum(ends - starts, region_length)
+    positions = np.arange(region_length)
+    values = buffer[np.minimum(starts[:, None] + positions, len(buffer) - 1)]
+    return np.all((values >= threshold) | (positions >= lengths[:, None]), axis=1)
+
+
+def select_chunk(data, line_ends, keep):
+    """Bytes of the records of a chunk whose keep entry is true."""
+    if keep.all():
+        return data
+    record_ends = line_ends[3::4] + 1
+    sizes = np.diff(record_ends, prepend=0)
+    return np.frombuffer(data, np.uint8)[np.repeat(keep, sizes)].tobytes()
+
+
+def write_quality_stats(path, name, total, passed):
+    """Reads passing and failing the barcode quality filter, one TSV row."""
+    with open(path, "w") as handle:
+        handle.write("sample\treads\tpassed\tfailed\n")
+        handle.write(f"{name}\t{total}\t{passed}\t{total - passed}\n")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Quality-filter, rename and count barcodes of a multiplexed FASTQ in one pass.
+
+Replaces the fastx_trimmer | fastq_quality_filter, seqkit grep, awk header
+rewrite and sort | uniq -c chain that previously read the raw file four times.
+Records are processed in chunks: the quality test, header renaming and record
+selection run vectorised over the whole chunk.
+Barcodes are counted in a bounded-memory histogram (see barcode_histogram.py).
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from barcode_histogram import BarcodeHistogram
+from fastq_io import (
+    line_starts,
+    open_input,
+    open_output,
+    phred_offset,
+    quality_pass,
+    read_chunks,
+    select_chunk,
+    write_quality_stats,
+)
+
+SPACE, SLASH, HASH = b" /#"
+
+
+def rename_headers(data, line_ends):
+    """Replace spaces and slashes in the FASTQ headers of a chunk so flexbar keeps the full ID."""
+    buffer = np.frombuffer(data, np.uint8)
+    header = np.zeros(len(buffer) + 1, dtype=np.int8)
+    header[line_starts(line_ends)[0::4]] += 1
+    header[line_ends[0::4]] -= 1
+    header = np.cumsum(header[:-1], dtype=np.int8).astype(bool)
+    replace = header & ((buffer == SPACE) | (buffer == SLASH))
+    if not replace.any():
+        return data
+    renamed = buffer.copy()
+    renamed[replace] = HASH
+    return renamed.tobytes()
+
+
+def preprocess(source, output, quality_length, min_base_quality, offset,
+               barcode_start, barcode_length, experimental_length, capacity, quality_filter=True):
+    counts = {"total": 0, "passed": 0}
+    histogram = BarcodeHistogram(capacity)
+    threshold = offset + min_base_quality
+    add_barcode = histogram.add
+    for data, line_ends in read_chunks(source):
+        records = len(line_ends) // 4
+        if quality_filter:
+            keep = quality_pass(data, line_ends, quality_length, threshold)
+        else:
+            keep = np.ones(records, dtype=bool)
+        counts["total"] += records
+        counts["passed"] += int(keep.sum())
+        output.write(select_chunk(rename_headers(data, line_ends), line_ends, keep))
+
+        # barcode region of the sequence line, cut at the line end (and \r)
+        sequence_starts = line_ends[0::4][keep] + 1
+        sequence_ends = line_ends[1::4][keep]
+        buffer = np.frombuffer(data, np.uint8)
+        sequence_ends = sequence_ends - (buffer[sequence_ends - 1] == 13)
+        starts = np.minimum(sequence_starts + barcode_start, sequence_ends)
+        ends = np.minimum(starts + barcode_length, sequence_ends)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            add_barcode(data[start:end], experimental_length)
+    return counts, histogram
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="-")
+    parser.add_argument("--output", default="-")
+    parser.add_argument("--barcodes-out", required=True)
+    parser.add_argument("--histogram-out", required=True)
+    parser.add_argument("--stats-out", help="TSV with the reads passing and failing the quality filter")
+    parser.add_argument("--quality-length", type=int, required=True)
+    parser.add_argument("--min-base-quality", type=int, required=True)
+    parser.add_argument("--seq-format", default="-Q33")
+    parser.add_argument("--barcode-start", type=int, required=True)
+    parser.add_argument("--barcode-length", type=int, required=True)
+    parser.add_argument("--experimental-length", type=int, required=True,
+                        help="length of the experimental barcode at the start of the barcode region")
+    parser.add_argument("--histogram-capacity", type=int, default=500000,
+                        help="maximum number of distinct barcode + UMI strings counted")
+    parser.add_argument("--skip-quality-filter", action="store_true")
+    args = parser.parse_args()
+
+    source = open_input(args.input)
+    output = open_output(args.output)
+    try:
+        counts, histogram = preprocess(
+            source,
+            output,
+            args.quality_length,
+            args.min_base_quality,
+            phred_offset(args.seq_format),
+            args.barcode_start,
+            args.barcode_length,
+            args.experimental_length,
+            args.histogram_capacity,
+            quality_filter=not args.skip_quality_filter,
+        )
+    finally:
+        output.flush()
+        if output is not sys.stdout.buffer:
+            output.close()
+    histogram.write_text(args.barcodes_out)
+    histogram.write_binary(args.histogram_out)
+    if args.stats_out:
+        write_quality_stats(args.stats_out, "multiplexed", counts["total"], counts["passed"])
+    print(
+        "Multiplexed preprocessing: "
+        f"{counts['passed']} of {counts['total']} reads passed the barcode quality filter; "
+        f"{len(histogram.experimental)} distinct experimental barcodes, "
+        f"{len(histogram.full.counts)} barcode + UMI strings kept.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
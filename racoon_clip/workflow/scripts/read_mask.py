@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Select FASTQ records with a keep/drop bitmask indexed by record ordinal.
+
+Replaces read-name ID lists + seqkit grep: the producers see reads in input
+order, so one bit per read is enough and selection is a single streaming pass.
+
+Mask layout: 8 byte magic, little-endian uint64 record count, then one bit
+per record (bit i lives in byte i // 8 at position i % 8).
+"""
+
+import argparse
+import struct
+import sys
+
+import numpy as np
+
+from fastq_io import (
+    open_input,
+    open_output,
+    phred_offset,
+    quality_pass,
+    read_chunks,
+    select_chunk,
+    write_quality_stats,
+)
+
+MAGIC = b"RCMASK1\0"
+HEADER = struct.Struct("<8sQ")
+SAM_SKIP_FLAGS = 0x100 | 0x800  # secondary and supplementary records
+
+
+class MaskBuilder:
+    """Accumulate keep/drop decisions in record order."""
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.records = 0
+        self.kept = 0
+
+    def add(self, keep):
+        position = self.records & 7
+        if position == 0:
+            self.bits.append(0)
+        if keep:
+            self.bits[-1] |= 1 << position
+            self.kept += 1
+        self.records += 1
+
+    def extend(self, keep):
+        """Add the decisions of a boolean array."""
+        # fill the partial last byte one by one, so the rest is byte-aligned
+        head = -self.records & 7
+        for value in keep[:head].tolist():
+            self.add(value)
+        keep = keep[head:]
+        self.bits += np.packbits(keep, bitorder="little").tobytes()
+        self.records += len(keep)
+        self.kept += int(keep.sum())
+
+    def write(self, path):
+        with open(path, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, self.records))
+            handle.write(self.bits)
+
+
+def read_mask(path):
+    """Return (record count, bit bytes) of a mask file."""
+    with open(path, "rb") as handle:
+        magic, records = HEADER.unpack(handle.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a racoon_clip read mask")
+        bits = handle.read()
+    if len(bits) != (records + 7) // 8:
+        raise ValueError(f"Read mask {path} is truncated")
+    return records, bits
+
+
+def quality_mask(source, region_length, min_base_quality, offset):
+    builder = MaskBuilder()
+    threshold = offset + min_base_quality
+    for data, line_ends in read_chunks(source):
+        builder.extend(quality_pass(data, line_ends, region_length, threshold))
+    return builder
+
+
+def unmapped_mask(sam):
+    """Keep reads whose primary SAM record is unmapped.
+
+    The SAM must list reads in input order (bowtie2 --reorder).
+    """
+    builder = MaskBuilder()
+    previous_name = None
+    for line in sam:
+        if line.startswith(b"@"):
+            continue
+        fields = line.split(b"\t", 2)
+        if len(fields) < 3:
+            continue
+        flag = int(fields[1])
+        if flag & SAM_SKIP_FLAGS:
+            continue
+        if fields[0] == previous_name:
+            raise ValueError(f"Read {fields[0].decode()} has more than one primary SAM record")
+        previous_name = fields[0]
+        builder.add(bool(flag & 0x4))
+    return builder
+
+
+def select_records(source, output, records, bits):
+    """Write records whose mask bit is set; returns the number written."""
+    keep = np.unpackbits(np.frombuffer(bits, np.uint8), count=records, bitorder="little").astype(bool)
+    written = 0
+    ordinal = 0
+    for data, line_ends in read_chunks(source):
+        chunk_records = len(line_ends) // 4
+        if ordinal + chunk_records > records:
+            raise ValueError(f"FASTQ has more records than the read mask ({records})")
+        chunk_keep = keep[ordinal:ordinal + chunk_records]
+        output.write(select_chunk(data, line_ends, chunk_keep))
+        written += int(chunk_keep.sum())
+        ordinal += chunk_records
+    if ordinal != records:
+        raise ValueError(f"FASTQ has {ordinal} records but the read mask has {records}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    quality = commands.add_parser("quality", help="keep reads with a high quality barcode/UMI region")
+    quality.add_argument("--input", default="-")
+    quality.add_argument("--mask", required=True)
+    quality.add_argument("--quality-length", type=int, required=True)
+    quality.add_argument("--min-base-quality", type=int, required=True)
+    quality.add_argument("--seq-format", default="-Q33")
+    quality.add_argument("--stats-out", help="TSV with the reads passing and failing the quality filter")
+    quality.add_argument("--name", default="", help="sample name for --stats-out")
+
+    unmapped = commands.add_parser("sam-unmapped", help="keep reads that are unmapped in a SAM file")
+    unmapped.add_argument("--sam", required=True)
+    unmapped.add_argument("--mask", required=True)
+    unmapped.add_argument("--count-out")
+
+    select = commands.add_parser("select", help="stream the FASTQ records kept by a mask")
+    select.add_argument("--input", default="-")
+    select.add_argument("--output", default="-")
+    select.add_argument("--mask", required=True)
+    args = parser.parse_args()
+
+    if args.command == "quality":
+        builder = quality_mask(
+            open_input(args.input), args.quality_length, args.min_base_quality, phred_offset(args.seq_format)
+        )
+        builder.write(args.mask)
+        if args.stats_out:
+            write_quality_stats(args.stats_out, args.name, builder.records, builder.kept)
+        print(f"Barcode quality mask: {builder.kept} of {builder.records} reads kept.", file=sys.stderr)
+    elif args.command == "sam-unmapped":
+        with open(args.sam, "rb") as sam:
+            builder = unmapped_mask(sam)
+        builder.write(args.mask)
+        if args.count_out:
+            with open(args.count_out, "w") as handle:
+                handle.write(f"{builder.kept} {args.mask}\n")
+        print(f"Unmapped read mask: {builder.kept} of {builder.records} reads kept.", file=sys.stderr)
+    else:
+        records, bits = read_mask(args.mask)
+        output = open_output(args.output)
+        try:
+            written = select_records(open_input(args.input), output, records, bits)
+        finally:
+            output.flush()
+            if output is not sys.stdout.buffer:
+                output.close()
+        print(f"Read mask selection: {written} of {records} reads written.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
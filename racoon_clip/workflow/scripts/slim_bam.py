@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Write a slim copy of a BAM file for the steps after the alignment.
+
+SEQ and QUAL are replaced by "*" and all tags but NH are dropped; positions,
+strands, CIGAR strings, flags and the read names (with the UMIs) are kept.
+The records are rewritten in BAM, without a round trip through SAM text, and
+the copy is indexed. Needs pysam.
+"""
+
+import argparse
+import sys
+
+KEEP_TAGS = ("NH",)
+
+
+def slim_bam(input_bam, output_bam, threads=1):
+    """Write the slim copy of input_bam and index it; returns the number of records."""
+    import pysam
+
+    records = 0
+    with pysam.AlignmentFile(input_bam, "rb", threads=threads) as source:
+        with pysam.AlignmentFile(output_bam, "wb", template=source, threads=threads) as target:
+            for read in source:
+                tags = [(tag, read.get_tag(tag)) for tag in KEEP_TAGS if read.has_tag(tag)]
+                read.query_sequence = None  # also removes the qualities
+                read.set_tags(tags)
+                target.write(read)
+                records += 1
+    pysam.index("-@", str(threads), output_bam)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", required=True, help="coordinate-sorted BAM file")
+    parser.add_argument("--output", required=True, help="slim BAM file, indexed as <output>.bai")
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+    records = slim_bam(args.input, args.output, max(args.threads, 1))
+    print(f"Wrote {records} slim records", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Split a FASTQ stream into N record-aligned shards.
+
+Records are dealt round-robin, so every shard gets the same number of reads
+(+-1) in a single pass. Each shard is written through its own compressor
+process.
+"""
+
+import argparse
+import subprocess
+import sys
+
+from fastq_io import read_records
+
+
+def split_records(source, outputs):
+    """Write record i to outputs[i % len(outputs)]; returns reads per shard."""
+    writes = [output.write for output in outputs]
+    counts = [0] * len(outputs)
+    shard = 0
+    for record in read_records(source):
+        writes[shard](b"".join(record))
+        counts[shard] += 1
+        shard += 1
+        if shard == len(writes):
+            shard = 0
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="-")
+    parser.add_argument("--outputs", nargs="+", required=True)
+    parser.add_argument("--compress", default="gzip -c", help="shell command compressing stdin to stdout")
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    processes = []
+    for path in args.outputs:
+        with open(path, "wb") as handle:
+            processes.append(subprocess.Popen(args.compress, shell=True, stdin=subprocess.PIPE, stdout=handle))
+    try:
+        counts = split_records(source, [process.stdin for process in processes])
+    finally:
+        for process in processes:
+            process.stdin.close()
+    failed = [path for path, process in zip(args.outputs, processes) if process.wait() != 0]
+    if failed:
+        sys.exit(f"Compression failed for: {', '.join(failed)}")
+    print(
+        f"Split {sum(counts)} reads into {len(counts)} shards of {min(counts)}-{max(counts)} reads.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -155,6 +155,7 @@ def main():
     parser.add_argument("--mir-starts-allowed", required=True)
     parser.add_argument("--mir-5prime-missing-allowed", required=True)
     parser.add_argument("--trim5", type=int, default=2)
+    parser.add_argument("--count-out", help="file for the number of reads written")
     args = parser.parse_args()
 
     reference_lengths = read_fasta_lengths(args.mir_fasta)
@@ -166,6 +167,9 @@ def main():
         parse_int_set(args.mir_starts_allowed),
         parse_int_set(args.mir_5prime_missing_allowed),
     )
+    if args.count_out:
+        with open(args.count_out, "w") as handle:
+            handle.write(f"{counts['written']}\n")
     print(
         "Canonical miRNA trimming: "
         f"{counts['written']} reads written; "
@@ -0,0 +1,90 @@
+"""Throughput of the native demultiplexer against flexbar.
+
+Uses example_data/example_iCLIP_multiplexed, replicated --copies times to get
+a measurable input. Both tools match the barcodes only (no adapter trimming),
+with the barcode settings of the demultiplex_flexbar rule. flexbar is skipped
+if it is not on the PATH (activate the racoon_main conda env to include it).
+
+    python tests/benchmark/benchmark_demultiplex.py --copies 500 --threads 1 4
+"""
+
+import argparse
+import gzip
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[2]
+EXAMPLE = REPO / "example_data/example_iCLIP_multiplexed"
+SCRIPT = REPO / "racoon_clip/workflow/scripts/demultiplex_native.py"
+
+
+def samples(barcodes):
+    return [line[1:].split()[0] for line in barcodes.read_text().splitlines() if line.startswith(">")]
+
+
+def count_reads(path):
+    with gzip.open(path, "rb") as handle:
+        return sum(1 for _ in handle) // 4
+
+
+def timed(command, directory):
+    start = time.perf_counter()
+    subprocess.run(command, cwd=directory, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=500, help="times the example reads are repeated")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--mismatches", type=int, default=0)
+    args = parser.parse_args()
+
+    barcodes = EXAMPLE / "barcodes.fa"
+    names = samples(barcodes)
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        reads = directory / "reads.fastq"
+        with gzip.open(EXAMPLE / "test_iCLIP_multi.chr21.fastq.gz", "rb") as handle:
+            data = handle.read()
+        with open(reads, "wb") as handle:
+            for _ in range(args.copies):
+                handle.write(data)
+        total = data.count(b"\n") // 4 * args.copies
+
+        results = []
+        for threads in args.threads:
+            outputs = [str(directory / f"native_{name}.fastq.gz") for name in names]
+            seconds = timed(
+                [sys.executable, str(SCRIPT), "--input", str(reads), "--barcodes", str(barcodes),
+                 "--samples", *names, "--outputs", *outputs, "--mismatches", str(args.mismatches),
+                 "--threads", str(threads), "--compress", "gzip -1 -c"],
+                directory,
+            )
+            results.append(("native", threads, seconds, [count_reads(path) for path in outputs]))
+
+        if shutil.which("flexbar"):
+            for threads in args.threads:
+                seconds = timed(
+                    ["flexbar", "-r", str(reads), "--zip-output", "GZ", "--threads", str(threads),
+                     "--barcodes", str(barcodes), "--barcode-unassigned", "--barcode-trim-end", "LTAIL",
+                     "--barcode-error-rate", "0", "--umi-tags", "-t", "flexbarOut"],
+                    directory,
+                )
+                outputs = [directory / f"flexbarOut_barcode_{name}.fastq.gz" for name in names]
+                results.append(("flexbar", threads, seconds, [count_reads(path) for path in outputs]))
+        else:
+            print("flexbar not found on PATH, only the native backend is measured", file=sys.stderr)
+
+    print(f"{total} reads, {len(names)} samples")
+    print(f"{'backend':<8} {'threads':>7} {'seconds':>8} {'reads/s':>10}  reads per sample")
+    for backend, threads, seconds, counts in results:
+        print(f"{backend:<8} {threads:>7} {seconds:>8.2f} {total / seconds:>10.0f}  {' '.join(map(str, counts))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import unittest
+
+from racoon_clip.aligners import alignment_counts, check_aligner, hisat2_options, parse_hisat2_summary, star_log
+
+SUMMARY = """HISAT2 summary stats:
+\tTotal reads: 1000
+\t\tAligned 0 time: 100 (10.00%)
+\t\tAligned 1 time: 850 (85.00%)
+\t\tAligned >1 times: 50 (5.00%)
+\tOverall alignment rate: 90.00%
+"""
+
+
+def log_rows(text):
+    # rows as the report reads them: empty lines skipped, tab separated
+    return [line.split("\t") for line in text.splitlines() if line]
+
+
+class TestAligners(unittest.TestCase):
+    def test_check_aligner(self):
+        self.assertEqual(check_aligner("HISAT2"), "hisat2")
+        with self.assertRaises(ValueError):
+            check_aligner("bwa")
+
+    def test_hisat2_options(self):
+        self.assertEqual(
+            hisat2_options(0.04, 1),
+            "--no-softclip --no-unal --score-min L,0,-0.24 -k 2",
+        )
+
+    def test_summary_as_star_log(self):
+        counts = parse_hisat2_summary(SUMMARY)
+        self.assertEqual(counts, {"input": 1000, "unmapped": 100, "unique": 850, "multi": 50})
+        rows = log_rows(star_log(counts, 1))
+        # positions used by the report (1-based rows 5, 8, 9, 23-26, 28-33)
+        self.assertEqual(len(rows), 36)
+        self.assertEqual(rows[4], [" " * 27 + "Number of input reads |", "1000"])
+        self.assertEqual(rows[7][1], "850")
+        self.assertEqual(rows[8][1], "85.00%")
+        self.assertEqual([row[1] for row in rows[22:26]], ["0", "0.00%", "50", "5.00%"])
+        self.assertEqual([row[1] for row in rows[31:33]], ["100", "10.00%"])
+
+    def test_multimappers_within_limit(self):
+        rows = log_rows(star_log(parse_hisat2_summary(SUMMARY), 10))
+        self.assertEqual([row[1] for row in rows[22:26]], ["50", "5.00%", "0", "0.00%"])
+
+    def test_multimappers_over_limit_removed_by_filter(self):
+        # 30 of the 50 multimapping reads are left after the [NH] filter
+        rows = log_rows(star_log(parse_hisat2_summary(SUMMARY), 10, kept_multi=30))
+        self.assertEqual([row[1] for row in rows[22:26]], ["30", "3.00%", "20", "2.00%"])
+        rows = log_rows(star_log(parse_hisat2_summary(SUMMARY), 1, kept_multi=0))
+        self.assertEqual([row[1] for row in rows[22:26]], ["0", "0.00%", "50", "5.00%"])
+        with self.assertRaises(ValueError):
+            star_log(parse_hisat2_summary(SUMMARY), 10, kept_multi=51)
+
+    def test_counts_of_split_alignment(self):
+        counts = alignment_counts(1000, 850, 50)
+        self.assertEqual(counts, {"input": 1000, "unmapped": 100, "unique": 850, "multi": 50})
+        with self.assertRaises(ValueError):
+            alignment_counts(10, 8, 5)
+
+    def test_incomplete_summary(self):
+        with self.assertRaises(ValueError):
+            parse_hisat2_summary("Total reads: 10\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
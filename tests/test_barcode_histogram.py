@@ -0,0 +1,86 @@
+import importlib.util
+import random
+import sys
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("barcode_histogram", SCRIPTS / "barcode_histogram.py")
+barcode_histogram = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(barcode_histogram)
+
+
+def skewed_barcodes(n, seed):
+    rng = random.Random(seed)
+    heavy = [f"HEAVY{i}".encode() for i in range(5)]
+    return [rng.choice(heavy) if rng.random() < 0.5 else f"rare{rng.randrange(5000)}".encode() for _ in range(n)]
+
+
+class TestSpaceSaving(unittest.TestCase):
+    def test_exact_below_capacity(self):
+        sketch = barcode_histogram.SpaceSaving(10)
+        for item in [b"b", b"a", b"b", b"c"]:
+            sketch.add(item)
+        self.assertEqual(sketch.items(), [(b"b", 2, 0), (b"a", 1, 0), (b"c", 1, 0)])
+        self.assertEqual(sketch.floor, 0)
+
+    def test_bounded_and_keeps_heavy_hitters(self):
+        items = skewed_barcodes(20000, seed=1)
+        truth = Counter(items)
+        sketch = barcode_histogram.SpaceSaving(50)
+        for item in items:
+            sketch.add(item)
+
+        self.assertEqual(len(sketch.counts), 50)
+        for barcode, count, error in sketch.items():
+            self.assertGreaterEqual(count, truth[barcode])
+            self.assertLessEqual(count - error, truth[barcode])
+        for barcode, count in truth.items():
+            if count > len(items) / 50:
+                self.assertIn(barcode, sketch.counts)
+
+
+class TestBarcodeHistogram(unittest.TestCase):
+    def fill(self, barcodes, capacity):
+        histogram = barcode_histogram.BarcodeHistogram(capacity)
+        for barcode in barcodes:
+            histogram.add(barcode, 5)
+        return histogram
+
+    def test_binary_round_trip(self):
+        histogram = self.fill([b"ACGTAAA", b"ACGTCCC", b"ACGTAAA", b""], 10)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "barcodes_detected.hist"
+            histogram.write_binary(path)
+            reads, floor, experimental, full = barcode_histogram.read_binary(path)
+
+        self.assertEqual((reads, floor), (4, 0))
+        self.assertEqual(experimental, {b"ACGTA": 2, b"ACGTC": 1, b"": 1})
+        self.assertEqual(full, {b"ACGTAAA": (2, 0), b"ACGTCCC": (1, 0), b"": (1, 0)})
+
+    def test_merge_of_shards(self):
+        items = skewed_barcodes(9000, seed=2)
+        truth = Counter(items)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for shard in range(3):
+                path = Path(directory) / f"shard_{shard}.hist"
+                self.fill(items[shard::3], 40).write_binary(path)
+                paths.append(path)
+            merged = barcode_histogram.merge(paths, 40)
+
+        self.assertEqual(merged.reads, 9000)
+        self.assertEqual(sum(merged.experimental.values()), 9000)
+        self.assertEqual(len(merged.full.counts), 40)
+        for barcode, count, _ in merged.full.items():
+            self.assertGreaterEqual(count, truth[barcode])
+        for barcode in (f"HEAVY{i}".encode() for i in range(5)):
+            self.assertIn(barcode, merged.full.counts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import gzip
+import importlib.util
+import io
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("collapse_reads", SCRIPTS / "collapse_reads.py")
+collapse_reads = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(collapse_reads)
+
+READS = (
+    "@r1_AAA\nACGTACGT\n+\nIIIIIIII\n"
+    "@r2_AAA\nACGTACGT\n+\nFFFFFFFF\n"
+    "@r3_CCC\nACGTACGT\n+\nIIIIIIII\n"
+    "@r4_AAA\nTTTTACGT\n+\nIIIIIIII\n"
+    "@r5_AAA\nACGTACGT\n+\nIIIIIIII\n"
+)
+
+
+def collapse(text, umi):
+    records = list(collapse_reads.read_records(io.BytesIO(text.encode())))
+    counts = collapse_reads.count_keys(records, umi)
+    output = io.BytesIO()
+    collapse_reads.collapse(records, counts, output, umi)
+    return output.getvalue().decode()
+
+
+class TestCollapseReads(unittest.TestCase):
+    def test_collapse_by_sequence_and_umi(self):
+        self.assertEqual(
+            collapse(READS, umi=True),
+            "@x3:r1_AAA\nACGTACGT\n+\nIIIIIIII\n"
+            "@x1:r3_CCC\nACGTACGT\n+\nIIIIIIII\n"
+            "@x1:r4_AAA\nTTTTACGT\n+\nIIIIIIII\n",
+        )
+
+    def test_collapse_by_sequence_only(self):
+        self.assertEqual(
+            collapse(READS, umi=False),
+            "@x4:r1_AAA\nACGTACGT\n+\nIIIIIIII\n"
+            "@x1:r4_AAA\nTTTTACGT\n+\nIIIIIIII\n",
+        )
+
+    def test_read_count(self):
+        self.assertEqual(collapse_reads.read_count("x12:r1_AAA"), (12, "r1_AAA"))
+        self.assertEqual(collapse_reads.read_count("r1_AAA"), (1, "r1_AAA"))
+
+    def test_command_line_reads_gzipped_input_twice(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "reads.fastq.gz"
+            with gzip.open(path, "wt") as handle:
+                handle.write(READS)
+            result = subprocess.run(
+                [sys.executable, str(SCRIPTS / "collapse_reads.py"), "collapse",
+                 "--input", str(path), "--decompress", "gzip -dc", "--umi", "--name", "s1",
+                 "--stats-out", str(Path(directory) / "stats.tsv")],
+                capture_output=True, check=True,
+            )
+            self.assertEqual(collapse_reads.read_stats(Path(directory) / "stats.tsv"), 5)
+        self.assertEqual(result.stdout.decode(), collapse(READS, umi=True))
+        self.assertIn(b"Collapsed 5 reads", result.stderr)
+
+    def test_split_reads(self):
+        self.assertEqual(collapse_reads.split_reads(10, [1, 1, 0, 1]), [4, 3, 0, 3])
+        self.assertEqual(collapse_reads.split_reads(7, [0, 0, 0, 0]), [0, 0, 0, 7])
+        self.assertEqual(sum(collapse_reads.split_reads(1000, [3, 7, 11, 13])), 1000)
+
+    def test_star_log_of_all_reads(self):
+        rows = [
+            ("Number of input reads", "10"),
+            ("Average input read length", "40"),
+            ("Uniquely mapped reads number", "6"),
+            ("Uniquely mapped reads %", "60.00%"),
+            ("Number of reads mapped to multiple loci", "2"),
+            ("% of reads mapped to multiple loci", "20.00%"),
+            ("Number of reads mapped to too many loci", "1"),
+            ("% of reads mapped to too many loci", "10.00%"),
+            ("Number of reads unmapped: too many mismatches", "0"),
+            ("% of reads unmapped: too many mismatches", "0.00%"),
+            ("Number of reads unmapped: too short", "1"),
+            ("% of reads unmapped: too short", "10.00%"),
+            ("Number of reads unmapped: other", "0"),
+            ("% of reads unmapped: other", "0.00%"),
+        ]
+        text = "".join(f"{label:>48} |\t{value}\n" for label, value in rows[:2])
+        text += "\n" + f"{'UNIQUE READS:':>48}\n"
+        text += "".join(f"{label:>48} |\t{value}\n" for label, value in rows[2:])
+        log = collapse_reads.star_log(text, 40, 30, 4)
+        values = dict(line.strip().split(" |\t") for line in log.splitlines() if " |\t" in line)
+        self.assertEqual(len(log.splitlines()), len(text.splitlines()))
+        self.assertIn(f"{'UNIQUE READS:':>48}\n", log)
+        self.assertEqual(values["Number of input reads"], "40")
+        self.assertEqual(values["Average input read length"], "40")
+        self.assertEqual(values["Uniquely mapped reads %"], "75.00%")
+        self.assertEqual(values["Number of reads mapped to multiple loci"], "4")
+        self.assertEqual(values["Number of reads mapped to too many loci"], "3")
+        self.assertEqual(values["Number of reads unmapped: too short"], "3")
+        self.assertEqual(values["% of reads unmapped: too short"], "7.50%")
+        with self.assertRaises(ValueError):
+            collapse_reads.star_log(text, 10, 30, 4)
+
+    def test_expand_restores_read_counts(self):
+        try:
+            import pysam
+        except ImportError:
+            self.skipTest("pysam not installed")
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "collapsed.bam"
+            target = Path(directory) / "expanded.bam"
+            header = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 1000}]}
+            with pysam.AlignmentFile(source, "wb", header=header) as handle:
+                for name, start in (("x3:r1_AAA", 10), ("r4_AAA", 20)):
+                    read = pysam.AlignedSegment(handle.header)
+                    read.query_name = name
+                    read.reference_id = 0
+                    read.reference_start = start
+                    read.cigarstring = "8M"
+                    read.query_sequence = "ACGTACGT"
+                    handle.write(read)
+            self.assertEqual(collapse_reads.mapped_reads(str(source)), (4, 0))
+            self.assertEqual(collapse_reads.expand(str(source), str(target), index=True), (2, 4))
+            self.assertTrue(Path(f"{target}.bai").exists())
+            with pysam.AlignmentFile(target, "rb") as handle:
+                reads = [(read.query_name, read.reference_start) for read in handle]
+        self.assertEqual(reads, [("r1_AAA", 10)] * 3 + [("r4_AAA", 20)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import gzip
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from racoon_clip.compression import (
+    compress_command,
+    decompress_command,
+    parse_stage_levels,
+    stage_level,
+)
+
+
+class TestCompression(unittest.TestCase):
+    def test_stage_levels_override_default(self):
+        levels = parse_stage_levels("umi_filter=1, non_chimeric=4")
+
+        self.assertEqual(levels, {"umi_filter": 1, "non_chimeric": 4})
+        self.assertEqual(stage_level("umi_filter", 6, levels), 1)
+        self.assertEqual(stage_level("headers", 6, levels), 6)
+
+    def test_empty_stage_levels(self):
+        self.assertEqual(parse_stage_levels(""), {})
+        self.assertEqual(parse_stage_levels(None), {})
+
+    def test_invalid_stage_levels(self):
+        for value in ("umi_filter", "unknown=3", "headers=10", "headers=fast"):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_stage_levels(value)
+        with self.assertRaises(ValueError):
+            stage_level("unknown", 6, {})
+
+    def test_commands(self):
+        self.assertEqual(
+            compress_command(8, 3),
+            "bgzip --threads 8 --compress-level 3 --stdout",
+        )
+        self.assertIn("bgzip --threads 1 --decompress --stdout", decompress_command(0, "reads.fastq.gz"))
+
+    def test_decompress_by_content(self):
+        # gzip and uncompressed files are read whatever their suffix
+        with tempfile.TemporaryDirectory() as directory:
+            files = {
+                "gzip.fastq.gz": gzip.compress(b"@r1\nACGT\n+\nIIII\n"),
+                "plain.fastq.gz": b"@r1\nACGT\n+\nIIII\n",
+                "plain's.fastq": b"@r1\nACGT\n+\nIIII\n",
+                "empty.fastq.gz": b"",
+            }
+            for name, content in files.items():
+                path = Path(directory) / name
+                path.write_bytes(content)
+                with self.subTest(name=name), open(path, "rb") as handle:
+                    output = subprocess.run(decompress_command(2, path), shell=True, stdin=handle,
+                                            stdout=subprocess.PIPE, check=True).stdout
+                    self.assertEqual(output, b"" if not content else b"@r1\nACGT\n+\nIIII\n")
+
+    @unittest.skipIf(shutil.which("bgzip") is None, "bgzip not installed")
+    def test_decompress_bgzf(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "reads.fastq.gz"
+            path.write_bytes(subprocess.run(compress_command(2, 6), shell=True, input=b"@r1\nACGT\n+\nIIII\n",
+                                            stdout=subprocess.PIPE, check=True).stdout)
+            self.assertEqual(path.read_bytes()[:4].hex(), "1f8b0804")
+            with open(path, "rb") as handle:
+                output = subprocess.run(decompress_command(2, path), shell=True, stdin=handle,
+                                        stdout=subprocess.PIPE, check=True).stdout
+            self.assertEqual(output, b"@r1\nACGT\n+\nIIII\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import gzip
+import importlib.util
+import io
+import itertools
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("crosslinks", SCRIPTS / "crosslinks.py")
+crosslinks = importlib.util.module_from_spec(SPEC)
+sys.modules["crosslinks"] = crosslinks  # worker pool pickles by module name
+SPEC.loader.exec_module(crosslinks)
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+try:
+    import pyBigWig
+except ImportError:
+    pyBigWig = None
+
+# name, chromosome, start, cigar, reverse
+READS = [
+    ("r1", 0, 0, "10M", False),         # starts at the chromosome start
+    ("r2", 0, 100, "10M", False),
+    ("r3", 0, 100, "10M", False),
+    ("r4", 0, 101, "10M", False),
+    ("r5", 0, 102, "10M", False),       # same count as r4 at the next site, joined
+    ("r6", 0, 103, "10M", False),
+    ("r7", 0, 200, "5M3000N5M", True),  # spliced, site far behind the window
+    ("r8", 0, 5000, "10M", True),
+    ("r9", 1, 40, "10M", False),
+    ("r10", 1, 90, "10M", True),        # ends at the chromosome end
+    ("r11", 2, 10, "10M", False),
+]
+
+PLUS = "chr1\t99\t100\t2\nchr1\t100\t103\t1\n"
+MINUS = "chr1\t3210\t3211\t1\nchr1\t5010\t5011\t1\n"
+
+
+def write_bam(path, contigs):
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"},
+              "SQ": [{"SN": name, "LN": length} for name, length in contigs]}
+    with pysam.AlignmentFile(path, "wb", header=header) as handle:
+        for name, contig, start, cigar, reverse in READS:
+            read = pysam.AlignedSegment(handle.header)
+            read.query_name = name
+            read.reference_id = contig
+            read.reference_start = start
+            read.cigarstring = cigar
+            read.is_reverse = reverse
+            read.query_sequence = "A" * read.infer_query_length()
+            handle.write(read)
+        unmapped = pysam.AlignedSegment(handle.header)
+        unmapped.query_name = "r12"
+        unmapped.is_unmapped = True
+        unmapped.query_sequence = "ACGT"
+        handle.write(unmapped)
+
+
+class TestCrosslinks(unittest.TestCase):
+    def test_runs_of_equal_counts(self):
+        output = io.StringIO()
+        crosslinks.write_bedgraph(output, "chr1", crosslinks.count_sites({5: 1, 3: 1, 4: 1, 6: 2, 8: 2}))
+        self.assertEqual(output.getvalue(), "chr1\t3\t6\t1\nchr1\t6\t7\t2\nchr1\t8\t9\t2\n")
+
+    def test_part_files(self):
+        strands = (crosslinks.count_sites({3: 1, 4: 1, 9: 5}), crosslinks.Sites())
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "0.sites"
+            crosslinks.save_part(path, strands)
+            loaded = crosslinks.load_part(path)
+        self.assertEqual([list(sites.runs()) for sites in loaded], [list(sites.runs()) for sites in strands])
+
+    def test_store_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "a.xl"
+            # written in header order, read in name order; chr3 has no sites
+            with crosslinks.StoreWriter(str(path), [("chr2", 100), ("chr10", 50), ("chr3", 10)]) as store:
+                store.write("chr2", (crosslinks.count_sites({0: 2}), crosslinks.count_sites({7: 1, 99: 3})))
+                store.write("chr10", (crosslinks.count_sites({3: 1, 4: 1, 9: 5}), crosslinks.Sites()))
+            self.assertEqual(sorted(item.name for item in Path(directory).iterdir()), ["a.xl"])
+            with crosslinks.CrosslinkStore(str(path)) as store:
+                self.assertEqual(store.chromosomes, [("chr10", 50), ("chr2", 100), ("chr3", 10)])
+                positions, counts = store.arrays("chr2", "minus")
+                self.assertEqual((positions.tolist(), counts.tolist()), ([7, 99], [1, 3]))
+                self.assertEqual(len(store.sites("chr3", "plus")), 0)
+                bedgraphs = (Path(directory) / "plus.bedGraph", Path(directory) / "minus.bedGraph")
+                crosslinks.export_store(store, bedgraphs)
+                del positions, counts
+            self.assertEqual(bedgraphs[0].read_text(), "chr10\t3\t5\t1\nchr10\t9\t10\t5\nchr2\t0\t1\t2\n")
+            self.assertEqual(bedgraphs[1].read_text(), "chr2\t7\t8\t1\nchr2\t99\t100\t3\n")
+            path.write_bytes(b"chr1\t0\t1\t1\n" * 2)
+            with self.assertRaises(ValueError):
+                crosslinks.CrosslinkStore(str(path))
+
+    def test_merge_sums_per_nucleotide(self):
+        samples = (
+            {"chr1": {10: 1, 11: 1, 12: 1, 20: 2}, "chr10": {5: 1}},
+            {"chr1": {12: 1, 13: 1, 14: 2, 15: 2}, "chr2": {0: 3}},
+        )
+        chrom_sizes = [("chr1", 100), ("chr2", 100), ("chr10", 100)]
+        with tempfile.TemporaryDirectory() as directory:
+            stores = []
+            for number, sample in enumerate(samples):
+                stores.append(str(Path(directory) / f"{number}.xl"))
+                with crosslinks.StoreWriter(stores[-1], chrom_sizes) as store:
+                    for contig, counts in sample.items():
+                        store.write(contig, (crosslinks.count_sites(counts), crosslinks.count_sites({1: number + 1})))
+            plus, minus = Path(directory) / "plus.bedGraph", Path(directory) / "minus.bedGraph"
+            self.assertEqual(crosslinks.merge_stores(stores, (str(plus), str(minus))), 3)
+            self.assertEqual(
+                plus.read_text(),
+                "chr1\t10\t12\t1\nchr1\t12\t13\t2\nchr1\t13\t14\t1\nchr1\t14\t16\t2\n"
+                "chr1\t20\t21\t2\nchr10\t5\t6\t1\nchr2\t0\t1\t3\n",
+            )
+            self.assertEqual(minus.read_text(), "chr1\t1\t2\t3\nchr10\t1\t2\t1\nchr2\t1\t2\t2\n")
+            with crosslinks.StoreWriter(stores[1], chrom_sizes[:2]):
+                pass
+            with self.assertRaises(ValueError):
+                crosslinks.merge_stores(stores, (str(plus), str(minus)))
+
+    def test_sparse_matrix_of_samples(self):
+        samples = (
+            {"chr2": ({5: 1}, {5: 2}), "chr10": ({7: 3}, {})},
+            {"chr2": ({5: 4, 6: 1}, {}), "chr1": ({}, {0: 1})},
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            stores = []
+            for number, sample in enumerate(samples):
+                stores.append(str(Path(directory) / f"{number}.xl"))
+                with crosslinks.StoreWriter(stores[-1], [("chr1", 10), ("chr2", 10), ("chr10", 10)]) as store:
+                    for contig, strands in sample.items():
+                        store.write(contig, [crosslinks.count_sites(counts) for counts in strands])
+            matrix, sites, columns = (Path(directory) / name for name in ("m.mtx.gz", "sites.tsv.gz", "samples.tsv"))
+            self.assertEqual(crosslinks.write_matrix(stores, ["a", "b"], str(matrix), str(sites), str(columns)), (5, 6))
+            self.assertEqual(sorted(path.name for path in Path(directory).iterdir()),
+                             ["0.xl", "1.xl", "m.mtx.gz", "samples.tsv", "sites.tsv.gz"])
+            with gzip.open(sites, "rt") as handle:
+                self.assertEqual(handle.read(), "chr1\t0\tminus\nchr10\t7\tplus\nchr2\t5\tplus\nchr2\t5\tminus\nchr2\t6\tplus\n")
+            with gzip.open(matrix, "rt") as handle:
+                self.assertEqual(handle.read().splitlines(), [
+                    "%%MatrixMarket matrix coordinate integer general", "5 2 6",
+                    "1 2 1", "2 1 3", "3 1 1", "3 2 4", "4 1 2", "5 2 1",
+                ])
+            self.assertEqual(columns.read_text(), "a\nb\n")
+
+    @unittest.skipIf(pyBigWig is None, "pyBigWig not installed")
+    def test_bigwig_of_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bedgraph, bigwig = Path(directory) / "a.bedGraph", Path(directory) / "a.bw"
+            with crosslinks.TrackWriter([bedgraph], [str(bigwig)], [("chr2", 100), ("chr10", 50)]) as writer:
+                writer.write("chr10", [crosslinks.count_sites({3: 1, 4: 1, 9: 5})])
+                writer.write("chr2", [crosslinks.count_sites({0: 2})])
+            with pyBigWig.open(str(bigwig)) as track:
+                self.assertEqual(track.chroms(), {"chr10": 50, "chr2": 100})
+                self.assertEqual(track.intervals("chr10"), ((3, 5, 1.0), (9, 10, 5.0)))
+                self.assertEqual(track.intervals("chr2"), ((0, 1, 2.0),))
+
+    @unittest.skipIf(pysam is None, "pysam not installed")
+    def test_extract_in_name_order(self):
+        # chr10 comes before chr2 (LC_COLLATE=C), whatever the order of the header
+        cases = (
+            (["chr1", "chr10", "chr2"], "chr10\t39\t40\t1\nchr2\t9\t10\t1\n"),
+            (["chr1", "chr2", "chr10"], "chr10\t9\t10\t1\nchr2\t39\t40\t1\n"),
+        )
+        # serial, and in parallel with and without an index of the BAM file
+        for (names, plus_tail), (threads, indexed) in itertools.product(cases, ((1, False), (3, False), (3, True))):
+            with self.subTest(names=names, threads=threads, indexed=indexed):
+                with tempfile.TemporaryDirectory() as directory:
+                    source = Path(directory) / "in.bam"
+                    store = Path(directory) / "in.xl"
+                    plus, minus = Path(directory) / "plus.bedGraph", Path(directory) / "minus.bedGraph"
+                    write_bam(source, list(zip(names, (10000, 100, 100))))
+                    if indexed:
+                        pysam.index(str(source))
+                    counts = crosslinks.extract_crosslinks(str(source), str(store), threads=threads)
+                    self.assertEqual(counts, (11, 9))
+                    with crosslinks.CrosslinkStore(str(store)) as sites:
+                        crosslinks.export_store(sites, (str(plus), str(minus)))
+                    self.assertEqual(plus.read_text(), PLUS + plus_tail)
+                    self.assertEqual(minus.read_text(), MINUS)
+                    self.assertEqual(sorted(path.name for path in Path(directory).iterdir()),
+                                     ["in.bam"] + ["in.bam.bai"] * indexed + ["in.xl", "minus.bedGraph", "plus.bedGraph"])
+
+    def test_small_contigs_are_batched(self):
+        contigs = [("chr1", 500), ("chr2", 300), ("s1", 10), ("s2", 0), ("s3", 20), ("s4", 100), ("s5", 5)]
+        # 935 reads, 4 jobs per thread on 2 threads: about 117 reads per job
+        self.assertEqual(crosslinks.plan_jobs(contigs, 2), [["chr1"], ["chr2"], ["s1", "s3", "s4"], ["s5"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
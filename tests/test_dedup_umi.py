@@ -0,0 +1,178 @@
+import datetime
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("dedup_umi", SCRIPTS / "dedup_umi.py")
+dedup_umi = importlib.util.module_from_spec(SPEC)
+sys.modules["dedup_umi"] = dedup_umi  # worker pool pickles by module name
+SPEC.loader.exec_module(dedup_umi)
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+HEADER = {"HD": {"VN": "1.6", "SO": "coordinate"},
+          "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}, {"SN": "chr3", "LN": 1000}]}
+
+# name, chromosome, start, cigar, reverse, mapping quality
+READS = [
+    ("r1_AAA", 0, 100, "10M", False, 255),
+    ("r2_AAA", 0, 100, "10M", False, 255),   # duplicate of r1
+    ("r3_CCC", 0, 100, "10M", False, 255),   # other UMI
+    ("r4_AAA", 0, 102, "2S8M", False, 255),  # same 5' end as r1 with the soft clip
+    ("r5_AAA", 0, 105, "5M", True, 255),     # reverse, 5' end 110
+    ("r6_AAA", 0, 106, "4M", True, 255),     # reverse, same 5' end as r5
+    ("r7_AAA", 0, 5000, "10M", False, 1),
+    ("r8_AAA", 0, 5000, "10M", False, 255),  # duplicate of r7 with a higher MAPQ
+    ("r9_GGG", 1, 50, "10M", False, 255),
+    ("r10_GGG", 1, 50, "10M", False, 255),
+]
+
+
+def write_bam(path, reads=READS):
+    with pysam.AlignmentFile(path, "wb", header=HEADER) as handle:
+        for name, contig, start, cigar, reverse, mapq in reads:
+            read = pysam.AlignedSegment(handle.header)
+            read.query_name = name
+            read.reference_id = contig
+            read.reference_start = start
+            read.cigarstring = cigar
+            read.is_reverse = reverse
+            read.mapping_quality = mapq
+            read.query_sequence = "A" * read.infer_query_length()
+            handle.write(read)
+    pysam.index(str(path))
+
+
+class TestDirectional(unittest.TestCase):
+    def test_hamming_neighbours(self):
+        pairs = {tuple(sorted(pair)) for pair in dedup_umi.hamming_neighbours(["AAAA", "AAAT", "AATT", "TAAA", "AAA"])}
+        self.assertEqual(pairs, {("AAAA", "AAAT"), ("AAAA", "TAAA"), ("AAAT", "AATT")})
+        self.assertTrue(dedup_umi.one_mismatch("AAAA", "AAAT"))
+        self.assertFalse(dedup_umi.one_mismatch("AAAA", "AATT"))
+        self.assertFalse(dedup_umi.one_mismatch("AAAA", "AAA"))
+
+    def test_buckets_for_many_umis(self):
+        # 20 UMIs are compared through the buckets, not pair by pair
+        counts = {"AA" + a + b: 2 for a in "ACGT" for b in "ACGTN" if a + b != "AA"}
+        counts["AAAA"] = 100
+        heads = dedup_umi.directional_heads(counts)
+        self.assertEqual(heads, ["AAAA"] + [umi for umi in counts if umi[2] != "A" and umi[3] != "A"])
+
+    def test_counts_decide_direction(self):
+        # 2 >= 2 * 2 - 1 is false in both directions: two clusters
+        self.assertEqual(dedup_umi.directional_heads({"AAAA": 2, "AAAT": 2}), ["AAAA", "AAAT"])
+        self.assertEqual(dedup_umi.directional_heads({"AAAT": 1, "AAAA": 5}), ["AAAA"])
+        # chains are followed: AAAA -> AAAT -> AATT
+        self.assertEqual(dedup_umi.directional_heads({"AAAA": 10, "AAAT": 4, "AATT": 1}), ["AAAA"])
+        # AAAT has too many reads to be an error of AAAA
+        self.assertEqual(dedup_umi.directional_heads({"AAAA": 10, "AAAT": 6, "AATT": 3}), ["AAAA", "AAAT"])
+
+
+@unittest.skipIf(pysam is None, "pysam not installed")
+class TestDedupUmi(unittest.TestCase):
+    def run_dedup(self, threads, method="unique", reads=READS, collapsed=False):
+        with tempfile.TemporaryDirectory() as directory:
+            source = Path(directory) / "in.bam"
+            target = Path(directory) / "out.bam"
+            write_bam(source, reads)
+            stats = dedup_umi.deduplicate_bam(str(source), str(target), threads, method=method, collapsed=collapsed)
+            with pysam.AlignmentFile(target, "rb") as handle:
+                names = [read.query_name for read in handle]
+            self.assertEqual(sorted(path.name for path in Path(directory).iterdir()), ["in.bam", "in.bam.bai", "out.bam"])
+        return names, stats
+
+    def test_unique_method(self):
+        names, stats = self.run_dedup(threads=1)
+        self.assertEqual(names, ["r1_AAA", "r3_CCC", "r5_AAA", "r8_AAA", "r9_GGG"])
+        self.assertEqual(stats.events["Input Reads"], 10)
+        self.assertEqual(stats.reads_out, 5)
+        # (+, 100), (-, 110), (+, 5000) on chr1, (+, 50) on chr2
+        self.assertEqual((stats.positions, stats.umis, stats.max_umis), (4, 5, 2))
+
+    def test_parallel_chromosomes_in_header_order(self):
+        serial_names, serial = self.run_dedup(threads=1)
+        names, stats = self.run_dedup(threads=3)
+        self.assertEqual(names, serial_names)
+        self.assertEqual(stats.events, serial.events)
+        self.assertEqual((stats.positions, stats.umis, stats.max_umis), (serial.positions, serial.umis, serial.max_umis))
+
+    def test_directional_method(self):
+        reads = [(f"r{number}_AAAA", 0, 100, "10M", False, 255) for number in range(3)]
+        reads += [
+            ("r3_AAAT", 0, 100, "10M", False, 255),  # error of AAAA (3 >= 2 * 1 - 1)
+            ("r4_AATT", 0, 100, "10M", False, 255),  # two mismatches to AAAA, one to AAAT
+            ("r5_GGGG", 0, 100, "10M", False, 255),
+            ("r6_AAAT", 0, 100, "10M", True, 255),   # other strand
+        ]
+        names, stats = self.run_dedup(threads=1, method="directional", reads=reads)
+        self.assertEqual(names, ["r0_AAAA", "r5_GGGG", "r6_AAAT"])
+        self.assertEqual((stats.positions, stats.umis, stats.max_umis), (2, 5, 4))
+        names, _ = self.run_dedup(threads=1, method="unique", reads=reads)
+        self.assertEqual(names, ["r0_AAAA", "r3_AAAT", "r4_AATT", "r5_GGGG", "r6_AAAT"])
+
+    def test_collapsed_reads_count_with_their_counts(self):
+        reads = [
+            ("r0_AAAA", 0, 100, "10M", False, 255),
+            ("x3:r1_AAAT", 0, 100, "10M", False, 255),  # 3 reads, so AAAA is its error
+            ("x2:r2_GGGG", 1, 50, "10M", False, 255),
+        ]
+        names, stats = self.run_dedup(threads=1, method="directional", reads=reads, collapsed=True)
+        self.assertEqual(names, ["r1_AAAT", "r2_GGGG"])
+        self.assertEqual((stats.events["Input Reads"], stats.reads_out), (6, 2))
+        names, stats = self.run_dedup(threads=1, method="directional", reads=reads)
+        self.assertEqual(names, ["r0_AAAA", "x2:r2_GGGG"])
+        self.assertEqual(stats.events["Input Reads"], 3)
+
+    def test_crosslinks_of_kept_reads(self):
+        reads = READS + [
+            ("r11_TTT", 2, 0, "10M", False, 255),   # starts at the chromosome start
+            ("r12_TTT", 2, 500, "10M", False, 255),
+            ("r13_TTT", 2, 501, "10M", False, 255),  # next to r12, joined
+            ("r14_TTT", 2, 990, "10M", True, 255),  # ends at the chromosome end
+        ]
+        for threads in (1, 3):
+            with tempfile.TemporaryDirectory() as directory:
+                source = Path(directory) / "in.bam"
+                store = Path(directory) / "out.xl"
+                plus, minus = Path(directory) / "plus.bedGraph", Path(directory) / "minus.bedGraph"
+                write_bam(source, reads)
+                stats = dedup_umi.deduplicate_bam(str(source), str(Path(directory) / "out.bam"), threads,
+                                                  crosslinks=str(store), bedgraphs=(str(plus), str(minus)))
+                self.assertEqual(
+                    plus.read_text(),
+                    "chr1\t99\t100\t2\nchr1\t4999\t5000\t1\nchr2\t49\t50\t1\nchr3\t499\t501\t1\n",
+                )
+                self.assertEqual(minus.read_text(), "chr1\t110\t111\t1\n")
+                with dedup_umi.CrosslinkStore(str(store)) as crosslinks:
+                    self.assertEqual(crosslinks.chromosomes, [("chr1", 100000), ("chr2", 100000), ("chr3", 1000)])
+                    self.assertEqual(list(crosslinks.sites("chr3", "plus").positions), [499, 500])
+                self.assertEqual(stats.reads_out, 9)
+
+    def test_log_layout_read_by_report(self):
+        stats = dedup_umi.DedupStats()
+        stats.events["Input Reads"] = 10
+        stats.reads_out = 5
+        stats.add_group(2)
+        stats.add_group(1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "x.duprm.log"
+            dedup_umi.write_log(path, "dedup_umi.py --input x.bam", stats, datetime.datetime.now(), {})
+            lines = path.read_text().splitlines()
+        # Report.rmd skips 57 lines and reads rows -6 to -3 from character 29 on
+        self.assertIn("INFO command:", lines[56])
+        rows = lines[57:]
+        numbers = [row[28:].split(":")[-1].strip() for row in rows[-6:-2]]
+        self.assertEqual(numbers, ["10", "5", "2", "1.50"])
+        self.assertTrue(rows[-1].startswith("# job finished"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import importlib.util
+import sys
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("demultiplex_native", SCRIPTS / "demultiplex_native.py")
+demultiplex_native = importlib.util.module_from_spec(SPEC)
+sys.modules["demultiplex_native"] = demultiplex_native  # worker pool pickles by module name
+SPEC.loader.exec_module(demultiplex_native)
+
+
+BARCODES = [("s1", "NNACGTNN"), ("s2", "NNTTTTNN"), ("s3", "NNACGTNN")]
+
+
+def record(name, sequence):
+    return f"@{name}\n{sequence}\n+\n{'I' * len(sequence)}\n"
+
+
+class TestNativeDemultiplex(unittest.TestCase):
+    def run_demultiplex(self, fastq, mismatches=0, threads=1, chunk_records=1000):
+        index = demultiplex_native.BarcodeIndex(BARCODES, mismatches)
+        outputs = [io.BytesIO() for _ in BARCODES]
+        unassigned = io.BytesIO()
+        counts = demultiplex_native.demultiplex(
+            io.BytesIO(fastq.encode()), index, outputs, unassigned, threads, chunk_records
+        )
+        return [output.getvalue().decode() for output in outputs], unassigned.getvalue().decode(), counts
+
+    def test_barcode_trim_and_umi_tag(self):
+        outputs, unassigned, counts = self.run_demultiplex(record("r1#1:N", "GCTTTTCAGGGA"))
+        self.assertEqual(outputs[1], "@r1#1:N_GCCA\nGGGA\n+\nIIII\n")
+        self.assertEqual(counts["assigned"], [0, 1, 0])
+        self.assertEqual(unassigned, "")
+
+    def test_shared_barcode_goes_to_all_samples(self):
+        outputs, _, counts = self.run_demultiplex(record("r1", "GCACGTCAGGGA"))
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertEqual(counts["assigned"], [1, 0, 1])
+
+    def test_mismatches(self):
+        fastq = record("r1", "GCACGACAGGGA") + record("r2", "GCNCGTCAGGGA")
+        _, unassigned, _ = self.run_demultiplex(fastq)
+        self.assertEqual(unassigned, fastq)
+        _, unassigned, counts = self.run_demultiplex(fastq, mismatches=1)
+        self.assertEqual(unassigned, "")
+        self.assertEqual(counts["assigned"], [2, 0, 2])
+
+    def test_equally_close_barcodes_are_unassigned(self):
+        index = demultiplex_native.BarcodeIndex([("a", "NAAAA"), ("b", "NAAAT")], 1)
+        self.assertIsNone(index.assign(b"GAAAC")[0])
+        self.assertEqual(index.assign(b"GAAAA")[0], 0)
+
+    def test_short_reads_are_unassigned(self):
+        _, unassigned, _ = self.run_demultiplex(record("r1", "GCACG"))
+        self.assertEqual(unassigned, record("r1", "GCACG"))
+
+    def test_worker_pool_keeps_input_order(self):
+        fastq = "".join(record(f"r{i}", "GCACGTCA" + "ACGT"[i % 4] * 5) for i in range(50))
+        single = self.run_demultiplex(fastq)
+        parallel = self.run_demultiplex(fastq, threads=2, chunk_records=7)
+        self.assertEqual(parallel, single)
+        self.assertEqual(single[2]["assigned"], [50, 0, 50])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import io
+import random
+import sys
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+import fastq_io  # noqa: E402
+
+
+def passes_quality(quality, region_length, threshold):
+    region = quality[:region_length].rstrip(b"\r\n")
+    return not region or min(region) >= threshold
+
+
+def random_fastq(n, seed):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        length = rng.randrange(0, 12)
+        quality = bytes(rng.randrange(33, 74) for _ in range(length))
+        records.append(b"@r%d 1:N/1\n%s\n+\n%s%s\n" % (i, b"A" * length, quality, b"\r" if i % 7 == 0 else b""))
+    return b"".join(records)
+
+
+class TestBatches(unittest.TestCase):
+    def test_chunks_hold_complete_records(self):
+        fastq = random_fastq(500, seed=1)
+        chunks = list(fastq_io.read_chunks(io.BytesIO(fastq), chunk_bytes=97))
+        self.assertEqual(b"".join(data for data, _ in chunks), fastq)
+        for data, line_ends in chunks:
+            self.assertEqual(len(line_ends) % 4, 0)
+            self.assertEqual(data.count(b"\n"), len(line_ends))
+
+    def test_missing_final_newline_and_truncated_input(self):
+        chunks = list(fastq_io.read_chunks(io.BytesIO(b"@r\nAC\n+\nII")))
+        self.assertEqual(chunks[0][0], b"@r\nAC\n+\nII\n")
+        with self.assertRaises(ValueError):
+            list(fastq_io.read_chunks(io.BytesIO(b"@r\nAC\n+\n")))
+
+    def test_quality_pass_matches_per_record_test(self):
+        fastq = random_fastq(2000, seed=2)
+        qualities = fastq.split(b"\n")[3::4]
+        for region_length, threshold in [(0, 50), (1, 40), (5, 40), (11, 35), (20, 60)]:
+            with self.subTest(region_length=region_length, threshold=threshold):
+                keep = []
+                for data, line_ends in fastq_io.read_chunks(io.BytesIO(fastq), chunk_bytes=1000):
+                    keep.extend(fastq_io.quality_pass(data, line_ends, region_length, threshold).tolist())
+                self.assertEqual(keep, [passes_quality(q, region_length, threshold) for q in qualities])
+
+    def test_select_chunk(self):
+        fastq = random_fastq(10, seed=3)
+        (data, line_ends), = fastq_io.read_chunks(io.BytesIO(fastq))
+        keep = fastq_io.np.array([i % 3 == 0 for i in range(10)])
+        records = [b"\n".join(lines) + b"\n" for lines in zip(*[iter(fastq.split(b"\n"))] * 4)]
+        self.assertEqual(fastq_io.select_chunk(data, line_ends, keep), b"".join(records[::3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("preprocess", SCRIPTS / "preprocess_multiplexed_fastq.py")
+preprocess = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(preprocess)
+
+
+def record(name, sequence, quality):
+    return f"@{name}\n{sequence}\n+\n{quality}\n"
+
+
+class TestPreprocessMultiplexed(unittest.TestCase):
+    def run_preprocess(self, fastq, quality_filter=True):
+        output = io.BytesIO()
+        counts, histogram = preprocess.preprocess(
+            io.BytesIO(fastq.encode()), output, 4, 10, 33, 1, 3, 2, 100, quality_filter=quality_filter
+        )
+        return output.getvalue().decode(), counts, histogram
+
+    def test_low_quality_barcode_is_removed(self):
+        fastq = record("good 1:N/1", "ACGTACGT", "IIIIIIII") + record("bad 1:N", "ACGTACGT", "II#IIIII")
+        output, counts, _ = self.run_preprocess(fastq)
+        self.assertEqual(counts, {"total": 2, "passed": 1})
+        self.assertEqual(output, record("good#1:N#1", "ACGTACGT", "IIIIIIII"))
+
+    def test_only_headers_are_renamed(self):
+        output, _, _ = self.run_preprocess(record("r 1/1", "ACGTACGT", "IIII//II"))
+        self.assertEqual(output, record("r#1#1", "ACGTACGT", "IIII//II"))
+
+    def test_quality_outside_barcode_region_is_ignored(self):
+        output, counts, _ = self.run_preprocess(record("read", "ACGTACGT", "IIII####"))
+        self.assertEqual(counts["passed"], 1)
+
+    def test_skip_quality_filter_keeps_all_reads(self):
+        _, counts, _ = self.run_preprocess(record("read", "ACGTACGT", "####IIII"), quality_filter=False)
+        self.assertEqual(counts["passed"], 1)
+
+    def test_barcode_counts_match_uniq_c_layout(self):
+        fastq = (
+            record("r1", "ACGTAAAA", "IIIIIIII")
+            + record("r2", "TTTTAAAA", "IIIIIIII")
+            + record("r3", "ACGTCCCC", "IIIIIIII")
+        )
+        _, _, histogram = self.run_preprocess(fastq)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "barcodes_detected.txt"
+            histogram.write_text(path)
+            self.assertEqual(path.read_text(), "      2 CGT\n      1 TTT\n")
+        self.assertEqual(histogram.experimental, {b"CG": 2, b"TT": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
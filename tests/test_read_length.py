@@ -0,0 +1,57 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+
+from racoon_clip.read_length import profile_read_lengths, sample_read_lengths, sjdb_overhang, trimmed_lengths
+
+
+def fastq(lengths):
+    return "".join(f"@r{i}\n{'A' * length}\n+\n{'I' * length}\n" for i, length in enumerate(lengths))
+
+
+class TestReadLength(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sample_is_bounded_and_reads_gzip(self):
+        plain = self.path / "reads.fastq"
+        plain.write_text(fastq([50, 51, 51, 120]))
+        packed = self.path / "reads.fastq.gz"
+        with gzip.open(packed, "wt") as handle:
+            handle.write(fastq([50, 51, 51, 120]))
+        self.assertEqual(sample_read_lengths(plain, 3), Counter({50: 1, 51: 2}))
+        self.assertEqual(sample_read_lengths(packed, 10), Counter({50: 1, 51: 2, 120: 1}))
+
+    def test_overhang_after_trimming(self):
+        lengths = trimmed_lengths(Counter({120: 5, 30: 1, 4: 1}), 9)
+        self.assertEqual(lengths, Counter({111: 5, 21: 1, 0: 1}))
+        self.assertEqual(sjdb_overhang(lengths), 110)
+        self.assertEqual(sjdb_overhang(Counter()), 1)
+
+    def test_cache_is_reused_until_the_file_changes(self):
+        reads = self.path / "reads.fastq"
+        reads.write_text(fastq([45, 45]))
+        cache = self.path / "results/tmp/read_length_profile.json"
+        self.assertEqual(profile_read_lengths([str(reads)], cache, 100)[str(reads)], Counter({45: 2}))
+
+        # a cached profile is returned without reading the file again
+        content = json.loads(cache.read_text())
+        content[str(reads.resolve())]["lengths"] = {"99": 7}
+        cache.write_text(json.dumps(content))
+        self.assertEqual(profile_read_lengths([str(reads)], cache, 100)[str(reads)], Counter({99: 7}))
+
+        reads.write_text(fastq([120, 120, 120]))
+        os.utime(reads, ns=(0, 10**18))
+        self.assertEqual(profile_read_lengths([str(reads)], cache, 100)[str(reads)], Counter({120: 3}))
+
+
+if __name__ == "__main__":
+    unittest.main()
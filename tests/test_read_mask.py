@@ -0,0 +1,80 @@
+import io
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("read_mask", SCRIPTS / "read_mask.py")
+read_mask = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(read_mask)
+
+
+def record(name, quality="IIII"):
+    return f"@{name}\nACGT\n+\n{quality}\n"
+
+
+class TestReadMask(unittest.TestCase):
+    def write_and_read(self, builder):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "reads.mask"
+            builder.write(path)
+            return read_mask.read_mask(path)
+
+    def test_mask_round_trip(self):
+        builder = read_mask.MaskBuilder()
+        for keep in [True, False] * 5:
+            builder.add(keep)
+        records, bits = self.write_and_read(builder)
+        self.assertEqual(records, 10)
+        self.assertEqual(bits, bytes([0b01010101, 0b01]))
+        self.assertEqual(builder.kept, 5)
+
+    def test_extend_after_partial_byte(self):
+        rng = np.random.default_rng(1)
+        chunks = [rng.random(size) < 0.5 for size in (3, 13, 1, 0, 30001, 8, 5)]
+        builder = read_mask.MaskBuilder()
+        for chunk in chunks:
+            builder.extend(chunk)
+        keep = np.concatenate(chunks)
+        records, bits = self.write_and_read(builder)
+        self.assertEqual(records, len(keep))
+        self.assertEqual(bits, np.packbits(keep, bitorder="little").tobytes())
+        self.assertEqual(builder.kept, int(keep.sum()))
+
+    def test_quality_mask_and_selection(self):
+        fastq = record("r1") + record("r2", "I#II") + record("r3")
+        builder = read_mask.quality_mask(io.BytesIO(fastq.encode()), 4, 10, 33)
+        records, bits = self.write_and_read(builder)
+        output = io.BytesIO()
+        written = read_mask.select_records(io.BytesIO(fastq.encode()), output, records, bits)
+        self.assertEqual(written, 2)
+        self.assertEqual(output.getvalue().decode(), record("r1") + record("r3"))
+
+    def test_unmapped_mask_uses_primary_records_only(self):
+        sam = (
+            b"@HD\tVN:1.0\n"
+            b"mapped\t0\tmir-1\t1\t42\t4M\t*\t0\t0\tACGT\tIIII\n"
+            b"mapped\t256\tmir-2\t1\t42\t4M\t*\t0\t0\tACGT\tIIII\n"
+            b"unmapped\t4\t*\t0\t0\t*\t*\t0\t0\tACGT\tIIII\n"
+        )
+        builder = read_mask.unmapped_mask(io.BytesIO(sam))
+        self.assertEqual((builder.records, builder.kept), (2, 1))
+        self.assertEqual(builder.bits, bytearray([0b10]))
+
+    def test_record_count_mismatch_is_an_error(self):
+        builder = read_mask.MaskBuilder()
+        builder.add(True)
+        with self.assertRaises(ValueError):
+            read_mask.select_records(
+                io.BytesIO((record("r1") + record("r2")).encode()), io.BytesIO(), builder.records, builder.bits
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from racoon_clip.resource_planning import job_threads, plan_threads, runtime
+
+
+class TestResourcePlanning(unittest.TestCase):
+    def test_single_job_stops_at_scaling_limit(self):
+        self.assertEqual(job_threads("flexbar", 64), 8)
+        self.assertEqual(job_threads("flexbar", 4), 4)
+        self.assertEqual(runtime("flexbar", 8), runtime("flexbar", 64))
+
+    def test_samples_share_the_cores(self):
+        self.assertEqual(job_threads("flexbar", 64, jobs=6), 8)
+        self.assertEqual(job_threads("star_align", 8, jobs=2), 4)
+        self.assertEqual(job_threads("flexbar", 8, jobs=8), 1)
+
+    def test_reserve_and_minimum(self):
+        self.assertEqual(job_threads("star_index", 8, reserve=2), 6)
+        self.assertEqual(job_threads("star_index", 1, reserve=2), 1)
+        self.assertEqual(job_threads("star_align", None), 1)
+
+    def test_plan_fits_into_cores(self):
+        for cores in (1, 2, 7, 16, 64):
+            for samples in (1, 3, 12):
+                plan = plan_threads(cores, samples, shards=4)
+                with self.subTest(cores=cores, samples=samples):
+                    self.assertTrue(all(1 <= threads <= cores for threads in plan.values()))
+                    self.assertLessEqual(plan["align"] * min(samples, cores // plan["align"]), cores)
+
+    def test_aligner_backend(self):
+        self.assertEqual(plan_threads(64, 1)["align"], 24)
+        self.assertEqual(plan_threads(64, 1, aligner="hisat2")["align"], 16)
+        self.assertEqual(plan_threads(64, 1, aligner="hisat2")["index"], 16)
+
+    def test_crosslinks_per_sample(self):
+        self.assertEqual(plan_threads(96, 1)["crosslinks"], 24)
+        self.assertEqual(plan_threads(96, 4)["crosslinks"], 24)
+        self.assertEqual(plan_threads(8, 8)["crosslinks"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
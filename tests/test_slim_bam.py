@@ -0,0 +1,50 @@
+import importlib.util
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("slim_bam", SCRIPTS / "slim_bam.py")
+slim_bam = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(slim_bam)
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+
+@unittest.skipIf(pysam is None, "pysam not installed")
+class TestSlimBam(unittest.TestCase):
+    def test_sequences_and_tags_removed(self):
+        header = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 1000}]}
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = Path(directory) / "in.bam", Path(directory) / "out.slim.bam"
+            with pysam.AlignmentFile(source, "wb", header=header) as handle:
+                for number, (start, tags) in enumerate([(10, [("NH", 1), ("AS", 9)]), (20, [("AS", 5)])]):
+                    read = pysam.AlignedSegment(handle.header)
+                    read.query_name = f"r{number}_ACGT"
+                    read.reference_id = 0
+                    read.reference_start = start
+                    read.cigarstring = "2S4M"
+                    read.is_reverse = bool(number)
+                    read.query_sequence = "ACGTAC"
+                    read.query_qualities = pysam.qualitystring_to_array("IIIIII")
+                    read.set_tags(tags)
+                    handle.write(read)
+            self.assertEqual(slim_bam.slim_bam(str(source), str(target), threads=2), 2)
+            self.assertTrue(Path(f"{target}.bai").exists())
+            with pysam.AlignmentFile(target, "rb") as handle:
+                reads = list(handle.fetch("chr1"))
+        self.assertEqual([read.query_name for read in reads], ["r0_ACGT", "r1_ACGT"])
+        self.assertEqual([(read.reference_start, read.cigarstring, read.is_reverse) for read in reads],
+                         [(10, "2S4M", False), (20, "2S4M", True)])
+        self.assertEqual([read.query_sequence for read in reads], [None, None])
+        self.assertEqual([read.get_tags() for read in reads], [[("NH", 1)], []])
+
+
+if __name__ == "__main__":
+    unittest.main()
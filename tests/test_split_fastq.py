@@ -0,0 +1,54 @@
+import io
+import importlib.util
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+
+SCRIPTS = Path(__file__).parents[1] / "racoon_clip/workflow/scripts"
+sys.path.insert(0, str(SCRIPTS))
+SPEC = importlib.util.spec_from_file_location("split_fastq", SCRIPTS / "split_fastq.py")
+split_fastq = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(split_fastq)
+
+
+def record(name):
+    return f"@{name} 1:N\nACGT\n+\nIIII\n"
+
+
+class TestSplitFastq(unittest.TestCase):
+    def test_records_are_dealt_round_robin(self):
+        fastq = "".join(record(f"r{i}") for i in range(7))
+        outputs = [io.BytesIO() for _ in range(3)]
+
+        counts = split_fastq.split_records(io.BytesIO(fastq.encode()), outputs)
+
+        self.assertEqual(counts, [3, 2, 2])
+        self.assertEqual(outputs[0].getvalue().decode(), record("r0") + record("r3") + record("r6"))
+        self.assertEqual(outputs[2].getvalue().decode(), record("r2") + record("r5"))
+
+    def test_incomplete_record_is_rejected(self):
+        with self.assertRaises(ValueError):
+            split_fastq.split_records(io.BytesIO(b"@r1\nACGT\n+\n"), [io.BytesIO()])
+
+    def test_shards_are_compressed_and_complete(self):
+        fastq = "".join(record(f"r{i}") for i in range(5))
+        with tempfile.TemporaryDirectory() as directory:
+            shards = [Path(directory) / f"raw_{i}.fastq.gz" for i in range(2)]
+            subprocess.run(
+                [sys.executable, str(SCRIPTS / "split_fastq.py"), "--outputs", *map(str, shards),
+                 "--compress", "gzip -1 -c"],
+                input=fastq.encode(),
+                check=True,
+                capture_output=True,
+            )
+            merged = b"".join(subprocess.run(["gzip", "-dc", str(shard)], check=True, capture_output=True).stdout
+                              for shard in shards)
+
+        self.assertEqual(sorted(merged.decode().splitlines()), sorted(fastq.splitlines()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from racoon_clip.star_index import (
+    MANIFEST,
+    adopt_index,
+    annotated_overhang,
+    build_locked,
+    cache_key,
+    cached_index,
+    index_complete,
+    junction_options,
+    star_version,
+    write_manifest,
+)
+
+
+class TestStarIndexManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.index = self.path / "genes_idx_sjdbOverhang104"
+        self.index.mkdir()
+        self.gtf = self.path / "genes.gtf"
+        self.gtf.write_text("chr1\ttest\texon\t1\t100\t.\t+\t.\tgene_id \"a\";\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_index_without_manifest_inserts_junctions(self):
+        self.assertEqual(
+            junction_options(self.index, self.gtf, 104),
+            f"--sjdbGTFfile {self.gtf} --sjdbOverhang 104",
+        )
+
+    def test_matching_manifest_skips_insertion(self):
+        write_manifest(self.index, self.gtf, 104, star_version="2.7.11b")
+        manifest = json.loads((self.index / MANIFEST).read_text())
+        self.assertEqual(manifest["sjdbOverhang"], 104)
+        self.assertEqual(manifest["star_version"], "2.7.11b")
+        self.assertEqual(junction_options(self.index, self.gtf, 104), "")
+        # the built-in overhang is kept, STAR cannot insert with another one
+        self.assertEqual(junction_options(self.index, self.gtf, 99), "")
+        self.assertEqual(annotated_overhang(self.index, self.gtf), 104)
+
+    def test_changed_gtf_falls_back_to_insertion(self):
+        write_manifest(self.index, self.gtf, 104)
+        self.gtf.write_text(self.gtf.read_text() * 2)
+        os.utime(self.gtf, ns=(0, 10**18))
+        self.assertIsNone(annotated_overhang(self.index, self.gtf))
+        self.assertTrue(junction_options(self.index, self.gtf, 104).startswith("--sjdbGTFfile"))
+
+
+class TestStarIndexCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.fasta = self.path / "genome.fa"
+        self.fasta.write_text(">chr1\n" + "ACGT" * 50 + "\n")
+        self.gtf = self.path / "genes.gtf"
+        self.gtf.write_text("chr1\ttest\texon\t1\t100\t.\t+\t.\tgene_id \"a\";\n")
+        self.generated = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def fake_star(self, command, **kwargs):
+        if "--version" in command:
+            return subprocess.CompletedProcess(command, 0, stdout="2.7.11a\n")
+        self.generated.append(command)
+        time.sleep(0.05)
+        genome_dir = Path(command[command.index("--genomeDir") + 1])
+        for name in ("SA", "SAindex", "Genome", "sjdbList.out.tab"):
+            (genome_dir / name).write_text("")
+        return subprocess.CompletedProcess(command, 0)
+
+    def test_key_depends_on_content_not_location(self):
+        copy = self.path / "copy"
+        copy.mkdir()
+        shutil.copy(self.fasta, copy / "other.fa")
+        shutil.copy(self.gtf, copy / "other.gtf")
+        key = cache_key(self.fasta, self.gtf, 100, "2.7.11a")
+        self.assertEqual(cache_key(copy / "other.fa", copy / "other.gtf", 100, "2.7.11a"), key)
+        self.assertNotEqual(cache_key(self.fasta, self.gtf, 99, "2.7.11a"), key)
+        self.assertNotEqual(cache_key(self.fasta, self.gtf, 100, "2.7.10b"), key)
+        self.gtf.write_text(self.gtf.read_text() * 2)
+        self.assertNotEqual(cache_key(self.fasta, self.gtf, 100, "2.7.11a"), key)
+
+    def test_hashes_are_remembered(self):
+        cache = self.path / "cache"
+        first = cached_index(cache, self.fasta, self.gtf, 100, "2.7.11a")
+        self.assertTrue((cache / "file_hashes.json").exists())
+        with mock.patch("racoon_clip.star_index.hashlib.sha256", wraps=__import__("hashlib").sha256) as sha256:
+            self.assertEqual(cached_index(cache, self.fasta, self.gtf, 100, "2.7.11a"), first)
+        # only the key itself is hashed, not the files again
+        self.assertEqual(sha256.call_count, 1)
+
+    def test_star_version_from_env(self):
+        env = self.path / "env.yml"
+        env.write_text("dependencies:\n  - python=3.10\n  - star=2.7.11a\n")
+        self.assertEqual(star_version(env), "2.7.11a")
+
+    def test_concurrent_builds_run_star_once(self):
+        index = cached_index(self.path / "cache", self.fasta, self.gtf, 100, "2.7.11a")
+        results = []
+        with mock.patch("racoon_clip.star_index.subprocess.run", side_effect=self.fake_star):
+            threads = [
+                threading.Thread(target=lambda: results.append(build_locked(index, self.fasta, self.gtf, 100, 1)))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(results), [False, False, True])
+        self.assertTrue(index_complete(index))
+        self.assertEqual(len(self.generated), 1)
+        self.assertEqual(annotated_overhang(index, self.gtf), 100)
+        self.assertTrue((Path(index) / "SA").exists())
+        self.assertFalse(Path(index.rstrip("/") + ".partial").exists())
+
+    def test_prebuilt_index_is_added_to_the_cache(self):
+        prebuilt = self.path / "prebuilt"
+        prebuilt.mkdir()
+        write_manifest(prebuilt, self.gtf, 100, self.fasta, "2.7.11a")
+        cache = self.path / "cache"
+        self.assertIsNone(adopt_index(prebuilt, cache, self.fasta, self.gtf, 99, "2.7.11a"))
+        self.assertIsNone(adopt_index(prebuilt, cache, self.fasta, self.gtf, 100, "2.7.10b"))
+        entry = adopt_index(prebuilt, cache, self.fasta, self.gtf, 100, "2.7.11a")
+        self.assertEqual(entry, cached_index(cache, self.fasta, self.gtf, 100, "2.7.11a"))
+        self.assertTrue(index_complete(entry))
+        self.assertEqual(Path(entry).resolve(), prebuilt.resolve())
+        # a later build finds it and does not run STAR
+        with mock.patch("racoon_clip.star_index.subprocess.run", side_effect=self.fake_star):
+            self.assertFalse(build_locked(entry, self.fasta, self.gtf, 100, 1))
+        self.assertEqual(self.generated, [])
+
+    def test_failed_build_leaves_no_index(self):
+        index = cached_index(self.path / "cache", self.fasta, self.gtf, 100, "2.7.11a")
+        failure = subprocess.CalledProcessError(1, "STAR")
+        with mock.patch("racoon_clip.star_index.subprocess.run", side_effect=failure):
+            with self.assertRaises(subprocess.CalledProcessError):
+                build_locked(index, self.fasta, self.gtf, 100, 1)
+        self.assertFalse(Path(index).exists())
+        self.assertFalse(index_complete(index))
+        with mock.patch("racoon_clip.star_index.subprocess.run", side_effect=self.fake_star):
+            self.assertTrue(build_locked(index, self.fasta, self.gtf, 100, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
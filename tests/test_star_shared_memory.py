@@ -0,0 +1,28 @@
+import ctypes
+import ctypes.util
+import tempfile
+import unittest
+from unittest import mock
+
+from racoon_clip import star_shared_memory
+from racoon_clip.star_shared_memory import remove_shared_genome, shm_key
+
+
+class TestStarSharedMemory(unittest.TestCase):
+    def test_key_matches_ftok(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        with tempfile.TemporaryDirectory() as directory:
+            expected = libc.ftok(directory.encode(), star_shared_memory.SHM_PROJECT_ID)
+            self.assertEqual(shm_key(directory), expected & 0xFFFFFFFF)
+
+    def test_remove_uses_ipcrm(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(star_shared_memory.subprocess, "run") as run:
+                run.return_value.returncode = 0
+                self.assertTrue(remove_shared_genome(directory))
+            run.assert_called_once_with(["ipcrm", "-M", str(shm_key(directory))], capture_output=True)
+        self.assertFalse(remove_shared_genome(directory))
+
+
+if __name__ == "__main__":
+    unittest.main()